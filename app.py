@@ -1,33 +1,142 @@
 # app.py - Main Flask Application
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash,
+                   jsonify, stream_with_context, before_render_template)
 from functools import wraps
 import models
+import database
+import maintenance
+import assets
+import css_pipeline
+import images
+import compression
+import stats
+import user_sessions
+from page_cache import page_cache
 from dotenv import load_dotenv
 load_dotenv()
+import csv
+import io
+import json
 import os
-import time
+from datetime import datetime, timedelta
 import subprocess
 import sys
 from email_smtp import generate_otp, send_otp_email
-from config import SECRET_KEY,ALLOWED_EXTENSIONS
+from config import (SECRET_KEY, SESSION_LIFETIME_DAYS, ALLOWED_EXTENSIONS, HOMEPAGE_CACHE_WARMUP,
+                    MAX_CONTENT_LENGTH, IMAGE_MAX_UPLOAD_BYTES, USE_X_SENDFILE,
+                    EMAIL_SPAM_WINDOW_MINUTES, IMPORT_MAX_PLAIN_PASSWORDS)
+from werkzeug.exceptions import RequestEntityTooLarge
+from passwords import HashingBusy, is_stored_hash
+from ratelimit import (RateLimit, RateLimited, limit, client_ip, form_field, session_value,
+                       describe_wait)
 
 
 app = Flask(__name__)
 
 app.secret_key = SECRET_KEY
-
-
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=SESSION_LIFETIME_DAYS)
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+app.jinja_env.add_extension('fragment_cache.FragmentCacheExtension')
+database.init_app(app)
+maintenance.init_app(app)
+css_pipeline.init_app(app)
+assets.init_app(app)
+compression.init_app(app)
+
+def responsive_image(name):
+    """src/srcset URLs of an image and its resized variants (for templates)"""
+    manifest = app.extensions['assets']
+    return images.ResponsiveImage(name, assets.static_url,
+                                  lambda filename: manifest.digest(filename) is not None)
+
+def image_variants_ready(files):
+    """Publish freshly swapped-in variants: new hashes, re-rendered homepage"""
+    for filename in files:
+        app.extensions['assets'].refresh(filename)
+    models.invalidate_homepage()
+
+app.add_template_global(responsive_image)
+
+_variants_checked = False
+
+def backfill_profile_variants():
+    """Build variants of a profile picture uploaded before they existed.
+
+    Runs on a worker's first request rather than at import, so scripts and
+    tests importing the app never build images or write to the database.
+    """
+    global _variants_checked
+    if _variants_checked:
+        return
+    _variants_checked = True
+    profile_path = os.path.join(app.static_folder, 'images', 'profile.png')
+    if os.path.exists(profile_path) and app.extensions['assets'].digest(
+            images.variant_name('profile', images.IMAGE_VARIANT_WIDTHS[-1], 'webp')) is None:
+        images.process_async(profile_path, app.static_folder, 'profile',
+                             on_done=image_variants_ready, remove_source=False)
+
+app.before_request(backfill_profile_variants)
+
+if HOMEPAGE_CACHE_WARMUP:
+    models.warm_homepage_cache()
+
+
+
+# Rendered output is flushed to the client in chunks of this many pieces
+STREAM_BUFFER_SIZE = 64
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response.
+
+    Like flask.stream_template, but buffers Jinja's small output pieces so
+    each write to the socket carries a reasonable amount of HTML. Sends
+    before_render_template like Flask does, so css_pipeline still adds the
+    stylesheet and critical CSS.
+    """
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    before_render_template.send(app, _async_wrapper=app.ensure_sync,
+                                template=template, context=context)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream), mimetype='text/html')
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# session user
+
+def start_user_session(user):
+    """Log ``user`` in (a row loaded with models.USER_SESSION_COLUMNS)"""
+    session['loggedIn'] = True
+    session['user_id'] = user['id']
+    session['username'] = user['username']
+    session['firstname'] = user['firstname']
+    session['role'] = user['role']
+    session['user'] = user_sessions.snapshot(user)
+
+def current_user():
+    """The logged-in user's session snapshot, or None.
+
+    Sessions whose snapshot was revoked (user deactivated, deleted or
+    edited by an admin) are cleared here without touching the users table.
+    """
+    if not session.get('loggedIn'):
+        return None
+    user = session.get('user')
+    if user is None or not user_sessions.is_current(user):
+        session.clear()
+        return None
+    return user
+
 # require login decorator
 
 def login_required(f):
     """Decorator to check if user is logged in"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('loggedIn'):
+        if current_user() is None:
             flash('Please login first!', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -37,26 +146,38 @@ def admin_required(f):
     """Decorator to check if user is admin"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('loggedIn'):
+        user = current_user()
+        if user is None:
             flash('Please login first!', 'error')
             return redirect(url_for('login'))
-        if session.get('role') != 'admin':
+        if user['role'] != 'admin':
             flash('Admin access required!', 'error')
             return redirect(url_for('user_dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
 @app.route('/')
+@page_cache.cached(version=models.homepage_cache.version)
 def index():
     """Homepage"""
-    user = None
-    if session.get('loggedIn'):
-        user = models.get_user_by_id(session.get('user_id'))
-    content = models.get_site_content()
-    admin = models.get_admin_user()
+    user = current_user()
+    content = models.get_cached_site_content()
+    admin = models.get_cached_admin_user()
     return render_template('index.html', user=user, content=content, admin=admin)
 
+# Throttling of the public auth forms (ratelimit.py); per-IP buckets allow
+# short bursts, per-account windows cap guessing and OTP emails
+LOGIN_IP = RateLimit('login-ip', 30, 5 * 60, 'token-bucket')
+LOGIN_USER = RateLimit('login-user', 10, 15 * 60)
+REGISTER_IP = RateLimit('register-ip', 10, 60 * 60, 'token-bucket')
+OTP_EMAILS = RateLimit('otp-email', 3, EMAIL_SPAM_WINDOW_MINUTES * 60)
+VERIFY_OTP_IP = RateLimit('verify-otp-ip', 30, 10 * 60, 'token-bucket')
+VERIFY_OTP_EMAIL = RateLimit('verify-otp-email', 5, 10 * 60)
+
 @app.route('/login', methods=['GET', 'POST'])
+@page_cache.cached()
+@limit(LOGIN_IP, client_ip)
+@limit(LOGIN_USER, form_field('username'))
 def login():
     """Login page"""
     if session.get('loggedIn'):
@@ -75,11 +196,7 @@ def login():
         
         if user:
             # session
-            session['loggedIn'] = True
-            session['user_id'] = user['id']
-            session['username'] = user['username']
-            session['firstname'] = user['firstname']
-            session['role'] = user['role']
+            start_user_session(user)
             
             flash(f'Welcome back, {user["firstname"]}!', 'success')
             
@@ -101,6 +218,8 @@ def logout():
     return redirect(url_for('login'))
 
 @app.route('/register', methods=['GET', 'POST'])
+@page_cache.cached()
+@limit(REGISTER_IP, client_ip)
 def register():
     """Registration page"""
     if session.get('loggedIn'):
@@ -131,14 +250,16 @@ def register():
             errors.append('Username already exists!')
         if models.get_user_by_email(email):
             errors.append('Email already registered!')
-        if models.check_email_spam(email):
-            errors.append('Too many OTP requests. Please try again later.')
         
         if errors:
             for error in errors:
                 flash(error, 'error')
             return render_template('register.html')
         
+        if not OTP_EMAILS.hit(email.strip().lower()).allowed:
+            flash('Too many OTP requests. Please try again later.', 'error')
+            return render_template('register.html')
+        
         # Save pending registration
         models.save_pending_registration(username, password, email, firstname, 
                                          middlename, lastname, birthday, contact)
@@ -146,7 +267,6 @@ def register():
         # Generate and save OTP
         otp = generate_otp()
         models.save_otp(email, otp)
-        models.log_email_sent(email)
         
         # Send OTP email
         send_otp_email(email, otp)
@@ -160,6 +280,8 @@ def register():
     return render_template('register.html')
 
 @app.route('/verify-otp', methods=['GET', 'POST'])
+@limit(VERIFY_OTP_IP, client_ip)
+@limit(VERIFY_OTP_EMAIL, session_value('pending_email'))
 def verify_otp():
     """OTP verification page"""
     if not session.get('pending_email'):
@@ -182,6 +304,8 @@ def verify_otp():
     return render_template('verify_otp.html', email=session.get('pending_email'))
 
 @app.route('/resend-otp')
+@limit(OTP_EMAILS, session_value('pending_email'), methods=('GET',),
+       redirect_endpoint='verify_otp')
 def resend_otp():
     """Resend OTP"""
     email = session.get('pending_email')
@@ -189,15 +313,9 @@ def resend_otp():
         flash('Please register first!', 'error')
         return redirect(url_for('register'))
     
-    # Check spam
-    if models.check_email_spam(email):
-        flash('Too many OTP requests. Please try again later.', 'error')
-        return redirect(url_for('verify_otp'))
-    
     # Generate new OTP
     otp = generate_otp()
     models.save_otp(email, otp)
-    models.log_email_sent(email)
     send_otp_email(email, otp)
     
     flash('New OTP has been sent!', 'success')
@@ -212,8 +330,7 @@ def user_dashboard():
     if session.get('role') == 'admin':
         return redirect(url_for('admin_dashboard'))
     
-    user = models.get_user_by_id(session.get('user_id'))
-    return render_template('user_dashboard.html', user=user)
+    return render_template('user_dashboard.html', user=current_user())
 
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
@@ -245,7 +362,7 @@ def profile():
                           birthday, contact, email)
         
         # Update session
-        session['firstname'] = firstname
+        start_user_session(models.get_user_by_id(user['id'], models.USER_SESSION_COLUMNS))
         
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
@@ -264,16 +381,35 @@ def games():
 @admin_required
 def admin_dashboard():
     """Admin dashboard"""
-    users = models.get_all_users()
-    user = models.get_user_by_id(session.get('user_id'))
-    return render_template('admin_dashboard.html', users=users, user=user)
+    users = models.get_recent_users(5)
+    user = current_user()
+    signups = stats.get_daily_signups()
+    return render_template('admin_dashboard.html', users=users, user=user,
+                           counters=stats.get_counters(), signups=signups,
+                           max_signups=max([count for _, count in signups] + [1]))
 
 @app.route('/admin/users')
 @admin_required
 def admin_users():
-    """Admin users management"""
-    users = models.get_all_users()
-    return render_template('admin_users.html', users=users)
+    """Admin users management (paginated, rows are streamed as they are rendered)"""
+    filters = {
+        'role': request.args.get('role') if request.args.get('role') in ('user', 'admin') else None,
+        'status': request.args.get('status') if request.args.get('status') in ('active', 'inactive') else None,
+        'sort': request.args.get('sort') if request.args.get('sort') in models.USER_SORT_COLUMNS else 'id',
+        'dir': 'asc' if request.args.get('dir') == 'asc' else 'desc'
+    }
+    is_active = None
+    if filters['status']:
+        is_active = 1 if filters['status'] == 'active' else 0
+
+    after = None
+    after_id = request.args.get('after_id', type=int)
+    if after_id is not None:
+        after = (request.args.get('after'), after_id)
+
+    page = models.get_users_page(role=filters['role'], is_active=is_active,
+                                 sort=filters['sort'], direction=filters['dir'], after=after)
+    return stream_page('admin_users.html', users=page, filters=filters)
 
 @app.route('/admin/add-user', methods=['GET', 'POST'])
 @admin_required
@@ -316,6 +452,144 @@ def admin_add_user():
     
     return render_template('admin_add_user.html')
 
+# ============ BULK IMPORT / EXPORT ============
+
+IMPORT_REQUIRED_FIELDS = ('username', 'email', 'firstname', 'lastname', 'birthday', 'contact')
+# Each row needs one of these: a plain-text password, hashed during the
+# import, or a hash exported from another system (passwords.is_stored_hash)
+IMPORT_PASSWORD_FIELDS = ('password', 'password_hash')
+EXPORT_FIELDS = ('id', 'username', 'email', 'firstname', 'middlename', 'lastname',
+                 'contact', 'role', 'is_active', 'created_at')
+# Rows rendered per chunk written to the client by the export
+EXPORT_CHUNK_ROWS = 500
+# Errors shown to the admin for a rejected import file
+MAX_IMPORT_ERRORS = 20
+
+def read_user_csv(file):
+    """Validate an uploaded user CSV in one pass.
+
+    Returns (users, errors): users as tuples ready for
+    models.bulk_create_users, errors as "line N: ..." messages. Conflicts
+    with existing accounts are checked afterwards with set-based queries.
+    Plain-text passwords are hashed inside the request, so at most
+    IMPORT_MAX_PLAIN_PASSWORDS rows may use them; larger imports bring
+    password_hash.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline=''))
+    fieldnames = reader.fieldnames or []
+    missing = [field for field in IMPORT_REQUIRED_FIELDS if field not in fieldnames]
+    if not any(field in fieldnames for field in IMPORT_PASSWORD_FIELDS):
+        missing.insert(1, ' or '.join(IMPORT_PASSWORD_FIELDS))
+    if missing:
+        return [], [f"Missing columns: {', '.join(missing)}"]
+
+    users = []
+    errors = []
+    usernames = set()
+    emails = set()
+    for line, row in enumerate(reader, start=2):
+        row = {key: (value or '').strip() for key, value in row.items() if key}
+        role = row.get('role') or 'user'
+        password, password_hash = row.get('password'), row.get('password_hash')
+        if not all(row.get(field) for field in IMPORT_REQUIRED_FIELDS) or not (password or password_hash):
+            errors.append(f"line {line}: missing required field")
+        elif password and password_hash:
+            errors.append(f"line {line}: give either password or password_hash, not both")
+        elif password_hash and not is_stored_hash(password_hash):
+            errors.append(f"line {line}: password_hash is not a supported hash")
+        elif role not in ('user', 'admin'):
+            errors.append(f"line {line}: invalid role '{role}'")
+        elif row['username'] in usernames:
+            errors.append(f"line {line}: duplicate username '{row['username']}' in file")
+        elif row['email'] in emails:
+            errors.append(f"line {line}: duplicate email '{row['email']}' in file")
+        else:
+            try:
+                datetime.strptime(row['birthday'], '%Y-%m-%d')
+            except ValueError:
+                errors.append(f"line {line}: birthday must be YYYY-MM-DD")
+                continue
+            usernames.add(row['username'])
+            emails.add(row['email'])
+            users.append((row['username'], password or None, row['email'], row['firstname'],
+                          row.get('middlename', ''), row['lastname'], row['birthday'],
+                          row['contact'], role, password_hash or None))
+
+    plain = sum(1 for user in users if user[1] is not None)
+    if plain > IMPORT_MAX_PLAIN_PASSWORDS:
+        errors.append(f"{plain} rows have plain-text passwords; hashing them would take too long, "
+                      f"so at most {IMPORT_MAX_PLAIN_PASSWORDS} are allowed. "
+                      f"Use a password_hash column for larger imports.")
+    return users, errors
+
+def render_import_page(**context):
+    return render_template('admin_import_users.html',
+                           max_plain_passwords=IMPORT_MAX_PLAIN_PASSWORDS, **context)
+
+@app.route('/admin/import-users', methods=['GET', 'POST'])
+@admin_required
+def admin_import_users():
+    """Admin bulk import users from CSV"""
+    if request.method == 'POST':
+        file = request.files.get('csv_file')
+        if not file or file.filename == '':
+            flash('No file selected!', 'error')
+            return render_import_page()
+
+        users, errors = read_user_csv(file)
+        if not errors and users:
+            taken = models.find_existing_usernames(user[0] for user in users)
+            registered = models.find_existing_emails(user[2] for user in users)
+            errors += [f"username '{name}' already exists" for name in sorted(taken)]
+            errors += [f"email '{email}' already registered" for email in sorted(registered)]
+
+        if errors:
+            flash(f'Import rejected: {len(errors)} problem(s) found, no users were created.', 'error')
+            return render_import_page(errors=errors[:MAX_IMPORT_ERRORS],
+                                      error_count=len(errors))
+        if not users:
+            flash('The file contains no users.', 'error')
+            return render_import_page()
+
+        created = models.bulk_create_users(users)
+        if created is None:
+            flash('Import failed, no users were created.', 'error')
+            return render_import_page()
+        flash(f'{created} users imported successfully!', 'success')
+        return redirect(url_for('admin_users'))
+
+    return render_import_page()
+
+def _export_chunks(fmt):
+    """Yield the users table as CSV or JSON Lines, a few hundred rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    for user in models.iter_all_users():
+        values = [user[field] for field in EXPORT_FIELDS]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values)), default=str) + '\n')
+        rows += 1
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@app.route('/admin/export-users.<fmt>')
+@admin_required
+def admin_export_users(fmt):
+    """Admin streaming export of all users (CSV or JSON Lines)"""
+    if fmt not in ('csv', 'jsonl'):
+        return render_template('404.html'), 404
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(_export_chunks(fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=users.{fmt}'})
+
 @app.route('/admin/edit-user/<int:user_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_edit_user(user_id):
@@ -360,6 +634,9 @@ def admin_edit_user(user_id):
         
         models.admin_update_user(user_id, username, email, firstname, middlename, 
                                  lastname, birthday, contact, role)
+        if user_id == session.get('user_id'):
+            # the edit revoked this session's snapshot; take a fresh one
+            start_user_session(models.get_user_by_id(user_id, models.USER_SESSION_COLUMNS))
         
         flash('User updated successfully!', 'success')
         return redirect(url_for('admin_users'))
@@ -380,6 +657,46 @@ def admin_delete_user(user_id):
     return redirect(url_for('admin_users'))
 
 
+# bulk action -> (models function, extra argument, past-tense label)
+BULK_ACTIONS = {
+    'activate': (models.bulk_update_status, 1, 'activated'),
+    'deactivate': (models.bulk_update_status, 0, 'deactivated'),
+    'make_admin': (models.bulk_update_role, 'admin', 'changed to admin'),
+    'make_user': (models.bulk_update_role, 'user', 'changed to user'),
+    'delete': (models.bulk_delete_users, None, 'deleted')
+}
+
+@app.route('/admin/users/bulk', methods=['POST'])
+@admin_required
+def admin_bulk_users():
+    """Admin apply one action to all selected users in a single statement"""
+    next_url = request.form.get('next', '')
+    if not next_url.startswith(url_for('admin_users')):
+        next_url = url_for('admin_users')
+
+    action = request.form.get('action')
+    if action not in BULK_ACTIONS:
+        flash('Please choose an action!', 'error')
+        return redirect(next_url)
+
+    user_ids = {int(value) for value in request.form.getlist('user_ids') if value.isdigit()}
+    # same rule as the single-user handlers: admins can't act on themselves
+    if session.get('user_id') in user_ids:
+        user_ids.discard(session.get('user_id'))
+        flash('Your own account was skipped.', 'error')
+    if not user_ids:
+        flash('No users selected!', 'error')
+        return redirect(next_url)
+
+    func, argument, label = BULK_ACTIONS[action]
+    ids = sorted(user_ids)
+    affected = func(ids) if argument is None else func(ids, argument)
+    if affected is None:
+        flash('Bulk action failed, no users were changed.', 'error')
+    else:
+        flash(f'{affected} user(s) {label} successfully!', 'success')
+    return redirect(next_url)
+
 @app.route('/admin/toggle-user/<int:user_id>')
 @admin_required
 def admin_toggle_user(user_id):
@@ -402,22 +719,38 @@ def admin_toggle_user(user_id):
 def admin_content():
     """Admin edit homepage content"""
     if request.method == 'POST':
-        models.update_site_content('site_title', request.form.get('site_title', ''))
-        models.update_site_content('tagline', request.form.get('tagline', ''))
-        models.update_site_content('about_me', request.form.get('about_me', ''))
-        models.update_site_content('dream_job_title', request.form.get('dream_job_title', ''))
-        models.update_site_content('dream_job_text', request.form.get('dream_job_text', ''))
+        keys = ('site_title', 'tagline', 'about_me', 'dream_job_title', 'dream_job_text')
+        if models.update_site_contents({key: request.form.get(key, '') for key in keys}) is None:
+            flash('Could not update homepage content!', 'error')
+            return redirect(url_for('admin_content'))
         
         flash('Homepage content updated successfully!', 'success')
         return redirect(url_for('admin_content'))
     
     content = models.get_site_content()
-    return render_template('admin_content.html', content=content, now=int(time.time()))
+    if content is None:
+        flash('Could not load homepage content!', 'error')
+        content = {}
+    return render_template('admin_content.html', content=content)
+
+@app.route('/admin/db-stats')
+@admin_required
+def admin_db_stats():
+    """Admin view of the heaviest database statements per route"""
+    order_by = request.args.get('order_by', 'total_time')
+    if order_by not in ('total_time', 'count', 'max_time', 'slow'):
+        order_by = 'total_time'
+    queries = database.top_queries(limit=50, order_by=order_by)
+    caches = {'homepage': models.homepage_cache.stats(), 'users': models.user_cache.stats(),
+              'pages': page_cache.stats(), 'fragments': app.jinja_env.fragment_cache.stats()}
+    return render_template('admin_db_stats.html', queries=queries, order_by=order_by,
+                           pool=database.pool_stats(), caches=caches)
 
 @app.route('/admin/upload-profile', methods=['POST'])
 @admin_required
 def admin_upload_profile():
     """Admin upload profile image"""
+    request.max_content_length = IMAGE_MAX_UPLOAD_BYTES
     if 'profile_image' not in request.files:
         flash('No file selected!', 'error')
         return redirect(url_for('admin_content'))
@@ -428,20 +761,47 @@ def admin_upload_profile():
         flash('No file selected!', 'error')
         return redirect(url_for('admin_content'))
     
-    if file and allowed_file(file.filename):
-        upload_folder = os.path.join(app.root_path, 'static', 'images')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        
-        filepath = os.path.join(upload_folder, 'profile.png')
-        file.save(filepath)
-        
-        flash('Profile image updated successfully!', 'success')
-    else:
+    if not allowed_file(file.filename):
         flash('Invalid file type! Please use PNG, JPG, or JPEG.', 'error')
-    
+        return redirect(url_for('admin_content'))
+
+    upload_path = images.save_upload(file, os.path.join(app.static_folder, 'images'))
+    try:
+        images.validate_image(upload_path)
+    except images.InvalidImage:
+        os.remove(upload_path)
+        flash('The file is not a valid PNG or JPG image!', 'error')
+        return redirect(url_for('admin_content'))
+
+    # resizing runs in the image pool; the new variants replace the old
+    # ones atomically and the homepage switches over when they are ready
+    images.process_async(upload_path, app.static_folder, 'profile',
+                         fallback='images/profile.png', on_done=image_variants_ready)
+    flash('Profile image uploaded! It will appear on the homepage in a moment.', 'success')
     return redirect(url_for('admin_content'))
 
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    """Upload bigger than MAX_CONTENT_LENGTH / IMAGE_MAX_UPLOAD_BYTES"""
+    if request.endpoint == 'admin_upload_profile':
+        flash(f'Image is too large! The limit is {IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)} MB.', 'error')
+        return redirect(url_for('admin_content'))
+    return 'Request body too large', 413
+
+@app.errorhandler(RateLimited)
+def rate_limited(error):
+    """Over one of the ratelimit.py limits; back to the form with a message"""
+    flash(f'Too many attempts. Please try again {describe_wait(error.retry_after)}.', 'error')
+    response = redirect(url_for(error.endpoint), code=303)
+    response.headers['Retry-After'] = str(int(error.retry_after) + 1)
+    return response
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(error):
+    """No password hashing slot came free within PASSWORD_HASH_WAIT_SECONDS"""
+    flash('The server is busy, please try again in a moment.', 'error')
+    return redirect(request.url, code=303)
+
 # Game launch routes
 @app.route('/launch_game/<game_name>', methods=['POST'])
 @login_required
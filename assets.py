@@ -0,0 +1,102 @@
+# assets.py - Content-hashed static file URLs
+#
+# static_url('css/style.css') returns /static/css/style.css?v=<hash of the
+# file>. Requests that carry the current hash are served with a one-year
+# immutable Cache-Control, so browsers never revalidate them; when a file
+# changes its URL changes with it.
+#
+# Hashes are computed once at startup and again only when a file's size or
+# modification time changes (checked with a stat() per URL), so a file
+# replaced by one worker gets its new hash in every worker.
+import hashlib
+import os
+import threading
+from flask import current_app, request, url_for
+from werkzeug.security import safe_join
+
+IMMUTABLE_MAX_AGE = 31536000
+
+# Hex digits of the SHA-256 digest used in URLs
+HASH_LENGTH = 12
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+class AssetManifest:
+    """filename (relative to the static folder) -> content hash"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._entries = {}       # filename -> (mtime_ns, size, digest)
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Hash every file under the static folder"""
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                self.refresh(os.path.relpath(path, self.static_folder).replace(os.sep, '/'))
+
+    def refresh(self, filename):
+        """Re-hash ``filename`` (e.g. right after it was replaced); None if missing"""
+        path = safe_join(self.static_folder, filename)
+        try:
+            stat = os.stat(path) if path else None
+            digest = file_digest(path) if stat else None
+        except OSError:
+            stat = digest = None
+        with self._lock:
+            if digest is None:
+                self._entries.pop(filename, None)
+            else:
+                self._entries[filename] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def digest(self, filename):
+        """Current hash of ``filename``, re-hashing it only if it changed on disk"""
+        entry = self._entries.get(filename)
+        path = safe_join(self.static_folder, filename)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None:
+            return None
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        return self.refresh(filename)
+
+
+def static_url(filename):
+    """URL of a static file, fingerprinted with its content hash"""
+    digest = current_app.extensions['assets'].digest(filename)
+    if digest is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=digest)
+
+def add_cache_headers(response):
+    """Far-future caching for static files requested with their current hash"""
+    if request.endpoint != 'static' or response.status_code not in (200, 304):
+        return response
+    version = request.args.get('v')
+    filename = (request.view_args or {}).get('filename')
+    if version and version == current_app.extensions['assets'].digest(filename):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+def init_app(app):
+    """Hash the static folder and register static_url() for templates"""
+    manifest = AssetManifest(app.static_folder)
+    manifest.build()
+    app.extensions['assets'] = manifest
+    app.add_template_global(static_url)
+    app.after_request(add_cache_headers)
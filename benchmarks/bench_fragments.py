@@ -0,0 +1,66 @@
+# bench_fragments.py - admin_users.html render time with cold and warm row fragments
+#
+# Usage: python benchmarks/bench_fragments.py [rows] [--seed]
+# Renders one list of ``rows`` users (default 10000) the way /admin/users
+# does. --seed first creates synthetic users until the table has enough.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+from flask import session
+from app import app
+import models
+import passwords
+
+
+def seed(rows):
+    existing = len(list(models.get_users_page(limit=rows)))
+    missing = rows - existing
+    if missing > 0:
+        stamp = int(time.time())
+        # one hash for every row, so seeding doesn't spend minutes hashing
+        password_hash = passwords.hash_password('benchpass')
+        models.bulk_create_users([
+            (f'bench{stamp}_{i}', None, f'bench{stamp}_{i}@example.com', 'Bench',
+             '', f'User {i}', '2000-01-01', '09000000000', 'user', password_hash)
+            for i in range(missing)
+        ])
+        print(f"Seeded {missing} users")
+
+
+def render(template, rows):
+    page = models.UserPage(iter(rows), len(rows), 'id')
+    start = time.perf_counter()
+    html = template.render(users=page, filters={'role': None, 'status': None,
+                                                'sort': 'id', 'dir': 'desc'})
+    return time.perf_counter() - start, len(html)
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    rows = int(args[0]) if args else 10000
+    with app.app_context():
+        if '--seed' in sys.argv:
+            seed(rows)
+        users = list(models.get_users_page(limit=rows))
+
+    store = app.jinja_env.fragment_cache
+    with app.test_request_context('/admin/users'):
+        session['user_id'] = 1
+        template = app.jinja_env.get_template('admin_users.html')
+        store.clear()
+        cold, size = render(template, users)
+        warm = min(render(template, users)[0] for _ in range(5))
+
+    print(f"{len(users)} rows, {size / 1024:.0f} KiB of HTML")
+    print(f"{'cold cache':<14}{cold * 1000:>10.1f} ms")
+    print(f"{'warm cache':<14}{warm * 1000:>10.1f} ms{cold / warm:>9.1f}x")
+    print(store.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# bench_passwords.py - Login verification throughput per password hash setting
+#
+# Usage: python benchmarks/bench_passwords.py [seconds] [method ...]
+# Verifies one stored hash per setting for ``seconds`` (default 3) through a
+# HashPool of PASSWORD_HASH_WORKERS threads and reports latency and logins
+# per second, in total and per core. No database is needed; hashing is
+# what a login spends its CPU on.
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+import passwords
+from config import PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS
+
+LEGACY = 'sha256 (legacy)'
+METHODS = [LEGACY, 'pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1']
+
+
+def stored_hash(method, password):
+    if method == LEGACY:
+        return hashlib.sha256(password.encode()).hexdigest()
+    return passwords._hash(password, method)
+
+
+def bench(pool, stored, password, seconds):
+    # keep every worker busy for ``seconds`` and count completed checks
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        pool.map(lambda _: passwords._check(stored, password), range(pool.workers * 4))
+        done += pool.workers * 4
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    args = sys.argv[1:]
+    seconds = float(args.pop(0)) if args and args[0].replace('.', '', 1).isdigit() else 3
+    methods = args or METHODS + ([PASSWORD_HASH_METHOD] if PASSWORD_HASH_METHOD not in METHODS else [])
+    cores = min(PASSWORD_HASH_WORKERS, os.cpu_count() or 1)
+    pool = passwords.HashPool(PASSWORD_HASH_WORKERS, wait_seconds=60)
+
+    print(f"{PASSWORD_HASH_WORKERS} hash workers, {os.cpu_count()} cores, {seconds:g} s per setting")
+    print(f"{'method':<26}{'latency':>12}{'logins/s':>12}{'per core':>12}")
+    for method in methods:
+        stored = stored_hash(method, 'benchmark password')
+        start = time.perf_counter()
+        passwords._check(stored, 'benchmark password')
+        latency = time.perf_counter() - start
+        rate = bench(pool, stored, 'benchmark password', seconds)
+        marker = '  <- PASSWORD_HASH_METHOD' if method == PASSWORD_HASH_METHOD else ''
+        print(f"{method:<26}{latency * 1000:>9.2f} ms{rate:>12.1f}{rate / cores:>12.1f}{marker}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# bench_prepared.py - Text protocol vs prepared statements for hot lookups
+#
+# Usage: python benchmarks/bench_prepared.py [iterations]
+# Needs the database from setup_database.py (uses the admin/testuser rows).
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+import database
+
+QUERIES = [
+    ('get_user_by_id', "SELECT * FROM users WHERE id = %s", (1,)),
+    ('get_user_by_username', "SELECT * FROM users WHERE username = %s", ('admin',)),
+    ('get_user_by_email', "SELECT * FROM users WHERE email = %s", ('admin@example.com',)),
+    ('cache_version', "SELECT version FROM cache_versions WHERE name = %s", ('homepage',)),
+]
+
+
+def bench_text(backend, conn, query, params, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cursor = backend.cursor(conn)
+        cursor.execute(query, params)
+        cursor.fetchall()
+        cursor.close()
+    return time.perf_counter() - start
+
+
+def bench_prepared(backend, conn, query, params, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cursor = backend.prepared_cursor(conn, query)
+        cursor.execute(query, params)
+        cursor.fetchall()
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    backend = database.get_backend()
+    conn = backend.acquire()
+    try:
+        print(f"{'query':<24}{'text ops/s':>14}{'prepared ops/s':>18}{'speedup':>10}")
+        for name, query, params in QUERIES:
+            # warm up both paths so the first prepare is not measured
+            bench_text(backend, conn, query, params, 10)
+            bench_prepared(backend, conn, query, params, 10)
+
+            text = bench_text(backend, conn, query, params, iterations)
+            prepared = bench_prepared(backend, conn, query, params, iterations)
+            print(f"{name:<24}{iterations / text:>14.0f}{iterations / prepared:>18.0f}"
+                  f"{text / prepared:>9.2f}x")
+    finally:
+        backend.release(conn)
+    print(backend.stats())
+
+
+if __name__ == '__main__':
+    main()
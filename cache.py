@@ -0,0 +1,286 @@
+# cache.py - In-process caches invalidated through database version stamps
+#
+# Each worker process keeps its own copy of rarely-changing data. Writers
+# bump a version row in cache_versions inside their transaction; readers
+# compare against it at most every CACHE_VERSION_CHECK_SECONDS, so every
+# worker sees a change within that interval while the worker that made the
+# change drops its copy immediately.
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config import CACHE_VERSION_CHECK_SECONDS
+from database import execute_query
+
+logger = logging.getLogger(__name__)
+
+
+def bump_version(cursor, name):
+    """Mark cache ``name`` stale for every worker (call inside the write's transaction)"""
+    cursor.execute("""
+        INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, (name,))
+
+
+class VersionStamp:
+    """This worker's view of one cache_versions row, re-read at most every ``interval``.
+
+    When the row cannot be read the last known version is kept, so a
+    database hiccup does not look like a content change.
+    """
+
+    def __init__(self, name, interval=CACHE_VERSION_CHECK_SECONDS):
+        self.name = name
+        self.interval = interval
+        self._version = None
+        self._checked = 0.0
+        self._reading = threading.Lock()
+
+    def _read(self):
+        rows = execute_query("SELECT version FROM cache_versions WHERE name = %s",
+                             (self.name,), fetch=True, prepared=True)
+        if rows is not None:     # None: the query failed, keep what we had
+            self._version = rows[0]['version'] if rows else 0
+        self._checked = time.monotonic()
+
+    def _read_in_background(self):
+        if not self._reading.acquire(blocking=False):
+            return
+
+        def read():
+            try:
+                self._read()
+            finally:
+                self._reading.release()
+
+        threading.Thread(target=read, name=f'version-{self.name}', daemon=True).start()
+
+    def current(self, wait=True):
+        """The version, re-read when older than ``interval``.
+
+        With ``wait=False`` an overdue version is returned as is while it
+        is re-read in the background (only the very first read blocks).
+        """
+        if self._checked and time.monotonic() - self._checked < self.interval:
+            return self._version
+        if not wait and self._version is not None:
+            self._read_in_background()
+            return self._version
+        self._read()
+        return self._version
+
+    def reset(self):
+        """Re-read the version on next use"""
+        self._checked = 0.0
+
+
+class TTLCache:
+    """Per-process cache of loader results, keyed by name.
+
+    Entries expire after ``ttl`` seconds or when the database version of
+    the cache changes. Only one thread per key runs the loader; the
+    others wait for it, or keep serving the expired value if there is one.
+    A loader returns None when its query failed: nothing is stored and the
+    expired value, if any, is served until a later load succeeds.
+    """
+
+    def __init__(self, name, ttl, version_check=CACHE_VERSION_CHECK_SECONDS):
+        self.name = name
+        self.ttl = ttl
+        self.version = VersionStamp(name, version_check)
+        self._entries = {}       # key -> (value, version, expires_at)
+        self._loading = {}       # key -> lock held while the loader runs
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = 0
+
+    def _fresh(self, entry):
+        return (entry is not None and entry[2] > time.monotonic()
+                and entry[1] == self.version.current())
+
+    def get(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` when stale"""
+        entry = self._entries.get(key)
+        if self._fresh(entry):
+            self.hits += 1
+            return entry[0]
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        if not key_lock.acquire(blocking=entry is None):
+            self.stale += 1
+            return entry[0]
+        try:
+            entry = self._entries.get(key)
+            if self._fresh(entry):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            version = self.version.current()
+            value = loader()
+            if value is None:
+                return entry[0] if entry is not None else None
+            self._entries[key] = (value, version, time.monotonic() + self.ttl)
+            return value
+        finally:
+            key_lock.release()
+
+    def invalidate(self):
+        """Drop this worker's entries and re-read the version on next use"""
+        self._entries.clear()
+        self.version.reset()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits,
+                'misses': self.misses, 'stale': self.stale}
+
+
+# ============ OBJECT CACHE ============
+
+class LRUBackend:
+    """Bounded in-process LRU store with a TTL per entry"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'entries': len(self._data), 'max_entries': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class NullBackend:
+    """Stores nothing; every lookup goes to the database"""
+
+    def __init__(self, **options):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'entries': 0, 'hits': 0, 'misses': self.misses, 'evictions': 0}
+
+
+# Storage backends by name. A backend shared between workers (e.g. in
+# shared memory) only has to provide get/set/delete/clear/stats and keep
+# the stored values picklable.
+CACHE_BACKENDS = {
+    'memory': LRUBackend,
+    'none': NullBackend
+}
+
+def create_backend(kind, **options):
+    try:
+        return CACHE_BACKENDS[kind](**options)
+    except KeyError:
+        raise ValueError(f"Unknown cache backend: {kind!r}") from None
+
+
+class ObjectCache:
+    """Rows cached by id, with secondary keys (aliases) pointing at the id.
+
+    An id entry holds one object per projection (``variant``) plus the
+    aliases that resolved to it, so invalidate(id) drops all of them. An
+    alias whose id entry is gone counts as a miss. Like TTLCache, the whole
+    cache is dropped when its version stamp changes in another worker.
+    """
+
+    def __init__(self, name, backend, version_check=CACHE_VERSION_CHECK_SECONDS):
+        self.name = name
+        self.backend = backend
+        self.version = VersionStamp(name, version_check)
+        self._seen_version = None
+
+    def _check_version(self):
+        version = self.version.current()
+        if version != self._seen_version:
+            self.backend.clear()
+            self._seen_version = version
+
+    def _store(self, obj_id, variant, obj, alias=None):
+        entry = self.backend.get(('id', obj_id)) or {'aliases': set(), 'variants': {}}
+        entry['variants'][variant] = obj
+        if alias is not None:
+            entry['aliases'].add(alias)
+            self.backend.set(alias, obj_id)
+        self.backend.set(('id', obj_id), entry)
+
+    def get(self, obj_id, variant, loader):
+        """Object ``obj_id`` in projection ``variant``, loading it on a miss"""
+        self._check_version()
+        entry = self.backend.get(('id', obj_id))
+        if entry is not None and variant in entry['variants']:
+            return entry['variants'][variant]
+        obj = loader()
+        if obj is not None:
+            self._store(obj_id, variant, obj)
+        return obj
+
+    def get_by(self, field, value, variant, loader):
+        """Object whose ``field`` equals ``value``; the loaded object must have an id"""
+        self._check_version()
+        alias = (field, value)
+        obj_id = self.backend.get(alias)
+        if obj_id is not None:
+            entry = self.backend.get(('id', obj_id))
+            if entry is not None and variant in entry['variants']:
+                return entry['variants'][variant]
+        obj = loader()
+        if obj is not None:
+            self._store(obj['id'], variant, obj, alias)
+        return obj
+
+    def invalidate(self, *obj_ids):
+        """Drop cached objects (and their aliases) after they were written"""
+        for obj_id in obj_ids:
+            entry = self.backend.get(('id', obj_id))
+            if entry is not None:
+                self.backend.delete(*entry['aliases'])
+            self.backend.delete(('id', obj_id))
+        self.version.reset()
+
+    def stats(self):
+        return self.backend.stats()
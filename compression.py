@@ -0,0 +1,182 @@
+# compression.py - Precompressed static files and compressed dynamic responses
+#
+# Static text files get .gz (and, with the optional brotli package, .br)
+# siblings written once at startup or with `python compression.py`. The
+# static route serves the best sibling the client accepts through
+# send_file, so the file is still handed to the server's sendfile path
+# (wsgi.file_wrapper, or X-Sendfile with USE_X_SENDFILE).
+#
+# Dynamic responses above COMPRESSION_MIN_SIZE are compressed in
+# after_request; streamed pages are compressed chunk by chunk with a sync
+# flush after each chunk so the browser can still render progressively.
+import gzip
+import logging
+import mimetypes
+import os
+import uuid
+import zlib
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+from config import (COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL,
+                    BROTLI_QUALITY, PRECOMPRESS_STATIC)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.txt', '.json', '.xml'}
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml',
+                          'application/json', 'application/x-ndjson', 'application/javascript',
+                          'image/svg+xml'}
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'} if brotli else {'gzip': '.gz'}
+
+
+def encoded_etags(etag):
+    """ETags a representation of ``etag`` can carry after compression"""
+    return [etag] + [f'{etag}-{coding}' for coding in ENCODINGS]
+
+def _negotiate():
+    for coding in ENCODINGS:
+        if request.accept_encodings[coding]:
+            return coding
+    return None
+
+# ============ STATIC FILES ============
+
+def _write_atomic(path, data):
+    # a name of our own, as every worker precompresses at startup
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _compress_file(path, coding):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if coding == 'br':
+        return brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def precompress_static(static_folder, min_size=COMPRESSION_MIN_SIZE):
+    """Write compressed siblings of compressible static files that are missing or stale"""
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+            for coding, suffix in ENCODINGS.items():
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime_ns >= stat.st_mtime_ns:
+                    continue
+                data = _compress_file(path, coding)
+                if len(data) >= stat.st_size:
+                    continue
+                _write_atomic(target, data)
+                written += 1
+    return written
+
+def send_static(filename):
+    """The app's static view, preferring a fresh precompressed sibling"""
+    app = current_app
+    coding = _negotiate() if os.path.splitext(filename)[1] in COMPRESSIBLE_EXTENSIONS else None
+    if coding is not None:
+        source = safe_join(app.static_folder, filename)
+        encoded = safe_join(app.static_folder, filename + ENCODINGS[coding])
+        try:
+            fresh = os.stat(encoded).st_mtime_ns >= os.stat(source).st_mtime_ns
+        except (OSError, TypeError):
+            fresh = False
+        if fresh:
+            response = send_from_directory(
+                app.static_folder, filename + ENCODINGS[coding],
+                mimetype=mimetypes.guess_type(filename)[0],
+                max_age=app.get_send_file_max_age(filename)
+            )
+            response.headers['Content-Encoding'] = coding
+            response.vary.add('Accept-Encoding')
+            return response
+    response = app.send_static_file(filename)
+    if os.path.splitext(filename)[1] in COMPRESSIBLE_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    return response
+
+# ============ DYNAMIC RESPONSES ============
+
+def _compressor(coding, level):
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+def _compress_stream(chunks, coding, level):
+    compress, flush, finish = _compressor(coding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def compress_response(response):
+    """Compress text responses the client accepts in gzip or brotli"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = _negotiate()
+    if coding is None:
+        return response
+
+    level = COMPRESSION_LEVEL
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, coding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+        compress, _, finish = _compressor(coding, level)
+        response.set_data(compress(data) + finish())
+    response.headers['Content-Encoding'] = coding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{coding}', weak)
+    return response
+
+def init_app(app):
+    """Serve precompressed static files and compress dynamic responses"""
+    if PRECOMPRESS_STATIC:
+        written = precompress_static(app.static_folder)
+        if written:
+            logger.info("Precompressed %d static files", written)
+        app.view_functions['static'] = send_static
+    if COMPRESSION_ENABLED:
+        app.after_request(compress_response)
+
+
+if __name__ == '__main__':
+    from flask import Flask
+    static_folder = Flask(__name__).static_folder
+    print(f"Wrote {precompress_static(static_folder)} compressed files"
+          f" ({', '.join(ENCODINGS)}) under {static_folder}")
@@ -1,15 +1,94 @@
 import os
+import tempfile
 
 SECRET_KEY = 'my_secret_12345'
+# Login sessions (and the user snapshots in them) last at most this long;
+# session revocations older than that are purged by maintenance.py
+SESSION_LIFETIME_DAYS = int(os.getenv('SESSION_LIFETIME_DAYS', 31))
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+# Request bodies above this are refused (413) before they are read;
+# image uploads have their own, smaller limit
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_MB', 32)) * 1024 * 1024
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_UPLOAD_MB', 8)) * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+# Square variants written for each uploaded image (1x, 2x, 3x of the smallest)
+IMAGE_VARIANT_WIDTHS = (120, 240, 360)
+IMAGE_WEBP_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Response compression (compression.py). Static text files are precompressed
+# at startup; dynamic text responses of at least COMPRESSION_MIN_SIZE bytes
+# (and all streamed pages) are compressed per request. brotli is optional.
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True') == 'True'
+PRECOMPRESS_STATIC = os.getenv('PRECOMPRESS_STATIC', 'True') == 'True'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+# Let the front-end server send static files itself (X-Sendfile)
+USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'False') == 'True'
+
+# Stylesheet pipeline (css_pipeline.py): inline each template's critical CSS
+# and load the minified sheet asynchronously. The build is redone on change
+# in debug mode, or always with CSS_AUTO_REBUILD.
+CSS_CRITICAL_INLINE = os.getenv('CSS_CRITICAL_INLINE', 'True') == 'True'
+CSS_AUTO_REBUILD = os.getenv('CSS_AUTO_REBUILD', 'False') == 'True'
+
+# Password hashing (passwords.py). PASSWORD_HASH_METHOD is a Werkzeug method
+# string ("scrypt:N:r:p" or "pbkdf2:sha256:iterations"); choose one with
+# `python passwords.py calibrate`. Stored hashes with other parameters are
+# upgraded on login. At most PASSWORD_HASH_WORKERS hashes run at once.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+PASSWORD_HASH_WAIT_SECONDS = float(os.getenv('PASSWORD_HASH_WAIT_SECONDS', 10))
+PASSWORD_HASH_TARGET_MS = float(os.getenv('PASSWORD_HASH_TARGET_MS', 100))
+# A CSV import hashes plain-text passwords inside the admin's request, each
+# costing about as much as a login; larger files must bring password_hash
+IMPORT_MAX_PLAIN_PASSWORDS = int(os.getenv('IMPORT_MAX_PLAIN_PASSWORDS', 100))
+
+# 'mysql' or 'sqlite' (embedded, single-node)
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
+
 DB_CONFIG = {
     'host': os.getenv('DB_HOST'),
     'user': os.getenv('DB_USER'),
     'password': os.getenv('DB_PASSWORD'), 
-    'database': os.getenv('DB_NAME', 'my_flask_db_web')
+    'database': os.getenv('DB_NAME', 'my_flask_db_web'),
+    'port': int(os.getenv('DB_PORT', 3306))
+}
+
+def _parse_replicas(value):
+    """Parse DB_REPLICAS, e.g. "db2:3307*2,db3" -> host, port and weight"""
+    replicas = []
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        address, _, weight = item.partition('*')
+        host, _, port = address.partition(':')
+        replicas.append({'host': host, 'port': int(port or 3306), 'weight': int(weight or 1)})
+    return replicas
+
+# Read replicas share DB_USER/DB_PASSWORD/DB_NAME with the primary
+DB_REPLICAS = _parse_replicas(os.getenv('DB_REPLICAS', ''))
+# After a write, reads stay on the primary for this long (read-your-writes)
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+# Connection pool settings (see database.ConnectionPool)
+DB_POOL_CONFIG = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 10)),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    'recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),
+    'pre_ping': os.getenv('DB_POOL_PRE_PING', 'True') == 'True'
+}
+
+SQLITE_CONFIG = {
+    'path': os.getenv('SQLITE_PATH', os.path.join('instance', 'app.db')),
+    'timeout': float(os.getenv('SQLITE_TIMEOUT', 5))
 }
 
+# Statements slower than this are written to the slow-query log
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')
+
 
 EMAIL_CONFIG = {
     'smtp_server': 'smtp.gmail.com',
@@ -18,4 +97,44 @@ EMAIL_CONFIG = {
     'password': os.getenv('EMAIL_PASSWORD'),
     "authorized_senders": "Blog web owner"
 }
-OTP_EXPIRY_MINUTES = 5
\ No newline at end of file
+OTP_EXPIRY_MINUTES = 5
+
+# Spam prevention: at most 3 OTP emails per address in this window
+EMAIL_SPAM_WINDOW_MINUTES = 60
+
+# Rate limiting (ratelimit.py): 'memory' (per worker), 'shared' (all workers
+# on this host, through a memory-mapped file) or 'database' (rate_limits)
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True') == 'True'
+RATELIMIT_BACKEND = os.getenv('RATELIMIT_BACKEND', 'shared')
+RATELIMIT_MEMORY_SIZE = int(os.getenv('RATELIMIT_MEMORY_SIZE', 100000))
+RATELIMIT_SHM_PATH = os.getenv('RATELIMIT_SHM_PATH',
+                               os.path.join(tempfile.gettempdir(), 'app-ratelimit.shm'))
+RATELIMIT_SHM_SLOTS = int(os.getenv('RATELIMIT_SHM_SLOTS', 65536))
+
+# Background maintenance (maintenance.py)
+MAINTENANCE_ENABLED = os.getenv('MAINTENANCE_ENABLED', 'True') == 'True'
+PURGE_INTERVAL_SECONDS = int(os.getenv('PURGE_INTERVAL_SECONDS', 300))
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 500))
+PURGE_BATCH_PAUSE = float(os.getenv('PURGE_BATCH_PAUSE', 0.05))
+PENDING_REGISTRATION_RETENTION_HOURS = 24
+STATS_RECONCILE_SECONDS = int(os.getenv('STATS_RECONCILE_SECONDS', 3600))
+
+# Per-worker caching of rarely-changing data (cache.py). Changes made by
+# another worker are noticed within CACHE_VERSION_CHECK_SECONDS.
+HOMEPAGE_CACHE_TTL = int(os.getenv('HOMEPAGE_CACHE_TTL', 300))
+HOMEPAGE_CACHE_WARMUP = os.getenv('HOMEPAGE_CACHE_WARMUP', 'True') == 'True'
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv('CACHE_VERSION_CHECK_SECONDS', 2))
+# User lookups by id/username/email: 'memory' (per-worker LRU) or 'none'
+USER_CACHE_BACKEND = os.getenv('USER_CACHE_BACKEND', 'memory')
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 2048))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+# Full-page cache for anonymous visitors (page_cache.py). Expired pages are
+# served while re-rendering; after a failed render the last good page is
+# served for PAGE_CACHE_RETRY_SECONDS before the database is tried again.
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'True') == 'True'
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', 30))
+PAGE_CACHE_RETRY_SECONDS = int(os.getenv('PAGE_CACHE_RETRY_SECONDS', 10))
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 256))
+# Rendered template fragments ({% cache %}, fragment_cache.py)
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 20000))
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', 3600))
@@ -0,0 +1,329 @@
+# css_pipeline.py - Minified stylesheet and per-template critical CSS
+#
+# static/css/style.css is parsed once into rules and written back minified
+# as css/style.min.css. For every template the rules that can match its
+# markup (the tags, classes and ids found in it and in the templates it
+# extends or includes) are kept as that template's critical CSS; base.html
+# inlines them in a <style> block and loads the full minified sheet without
+# blocking the first paint.
+#
+# Matching is static, so rules for markup created later (JavaScript, hover
+# and focus states) are left to the full sheet. Class attributes with a
+# Jinja expression (class="flash-message {{ category }}") match every
+# compound selector on their static classes.
+#
+# The build runs at startup, and again before a request whenever the
+# stylesheet or a template changed while the app runs in debug mode (or with
+# CSS_AUTO_REBUILD), so edits show up on the next reload. The minified file
+# is only rewritten when its content changes.
+import logging
+import os
+import re
+import threading
+import uuid
+from flask import before_render_template, current_app
+from markupsafe import Markup
+from config import CSS_CRITICAL_INLINE, CSS_AUTO_REBUILD
+
+logger = logging.getLogger(__name__)
+
+SOURCE = 'css/style.css'
+MINIFIED = 'css/style.min.css'
+
+# At-rules whose block holds rules rather than declarations
+NESTED_AT_RULES = {'@media', '@supports'}
+
+# Present in every page even if a template never spells them out
+DOCUMENT_TAGS = {'html', 'head', 'body'}
+
+# Pseudo-classes that only apply after user interaction
+INTERACTIVE_PSEUDO = re.compile(r':(hover|focus|focus-within|focus-visible|active|visited|checked)\b')
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_JINJA = re.compile(r'\{[{%#].*?[}%#]\}', re.S)
+_TAG = re.compile(r'<([a-zA-Z][\w-]*)')
+_ATTRIBUTE = re.compile(r'\b(class|id)\s*=\s*"([^"]*)"')
+_DEPENDENCY = re.compile(r'\{%-?\s*(?:extends|include|import|from)\s+["\']([^"\']+)["\']')
+_PSEUDO = re.compile(r'::?[\w-]+(\([^)]*\))?')
+_COMBINATOR = re.compile(r'\s*([>+~])\s*|\s+')
+
+
+# ============ PARSING AND MINIFYING ============
+
+def _skip_string(css, pos):
+    quote = css[pos]
+    pos += 1
+    while pos < len(css) and css[pos] != quote:
+        pos += 2 if css[pos] == '\\' else 1
+    return pos + 1
+
+def _split_top_level(text, separator):
+    """Split on ``separator`` outside strings and parentheses"""
+    parts, depth, start, pos = [], 0, 0, 0
+    while pos < len(text):
+        ch = text[pos]
+        if ch in '"\'':
+            pos = _skip_string(text, pos)
+            continue
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == separator and depth == 0:
+            parts.append(text[start:pos])
+            start = pos + 1
+        pos += 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def _parse_block(css, pos):
+    """Rules up to the matching '}': (prelude, declarations | [rules] | None)"""
+    rules, start = [], pos
+    while pos < len(css):
+        ch = css[pos]
+        if ch in '"\'':
+            pos = _skip_string(css, pos)
+            continue
+        if ch == '}':
+            return rules, pos + 1
+        if ch == ';':
+            statement = css[start:pos].strip()
+            if statement:
+                rules.append((statement, None))
+            start = pos + 1
+        elif ch == '{':
+            prelude = css[start:pos].strip()
+            if prelude.split(None, 1)[0].lower() in NESTED_AT_RULES:
+                body, pos = _parse_block(css, pos + 1)
+            else:
+                end, depth = pos + 1, 1
+                while depth:
+                    if css[end] in '"\'':
+                        end = _skip_string(css, end)
+                        continue
+                    depth += {'{': 1, '}': -1}.get(css[end], 0)
+                    end += 1
+                body, pos = css[pos + 1:end - 1], end
+            rules.append((prelude, body))
+            start = pos
+            continue
+        pos += 1
+    return rules, pos
+
+def parse(css):
+    """Top-level rules of a stylesheet, comments removed"""
+    return _parse_block(_COMMENT.sub('', css), 0)[0]
+
+def _minify_selector(selector):
+    selector = re.sub(r'\s+', ' ', selector)
+    return re.sub(r'\s*([,>+~])\s*', r'\1', selector)
+
+def _minify_declarations(body):
+    if '{' in body:      # @keyframes, @font-face with nested blocks
+        return ''.join(_minify_rule(rule) for rule in parse(body))
+    declarations = []
+    for declaration in _split_top_level(body, ';'):
+        name, _, value = declaration.partition(':')
+        value = re.sub(r'\s+', ' ', value.strip())
+        value = re.sub(r'\s*,\s*', ',', value).replace(' !important', '!important')
+        declarations.append(f'{name.strip()}:{value}')
+    return ';'.join(declarations)
+
+def _minify_rule(rule):
+    prelude, body = rule
+    if body is None:
+        return re.sub(r'\s+', ' ', prelude) + ';'
+    if isinstance(body, list):
+        inner = ''.join(_minify_rule(child) for child in body)
+        return re.sub(r'\s+', ' ', prelude) + '{' + inner + '}'
+    declarations = _minify_declarations(body)
+    if not declarations:
+        return ''
+    return f'{_minify_selector(prelude)}{{{declarations}}}'
+
+def minify(rules):
+    return ''.join(_minify_rule(rule) for rule in rules)
+
+
+# ============ CRITICAL CSS ============
+
+class TemplateMarkup:
+    """Tags, classes and ids a template (with its parents and includes) can emit"""
+
+    def __init__(self):
+        self.tags = set(DOCUMENT_TAGS)
+        self.classes = set()
+        self.ids = set()
+        # classes next to a Jinja expression in the same class attribute
+        self.open_classes = set()
+
+    def add_source(self, source):
+        self.tags.update(tag.lower() for tag in _TAG.findall(source))
+        for attribute, value in _ATTRIBUTE.findall(source):
+            dynamic = '{{' in value
+            names = _JINJA.sub(' ', value).split()
+            if attribute == 'id':
+                self.ids.update(names)
+            else:
+                self.classes.update(names)
+                if dynamic:
+                    self.open_classes.update(names)
+
+    def _matches_compound(self, compound):
+        compound = _PSEUDO.sub('', compound)
+        if not compound or compound == '*':
+            return True
+        tag = re.match(r'[a-zA-Z][\w-]*', compound)
+        if tag and tag.group(0).lower() not in self.tags:
+            return False
+        if any(name not in self.ids for name in re.findall(r'#([\w-]+)', compound)):
+            return False
+        classes = re.findall(r'\.([\w-]+)', compound)
+        if any(name in self.open_classes for name in classes):
+            return True
+        return all(name in self.classes for name in classes)
+
+    def matches(self, selector):
+        if INTERACTIVE_PSEUDO.search(selector):
+            return False
+        return all(self._matches_compound(compound)
+                   for compound in _COMBINATOR.split(selector) if compound)
+
+    def critical(self, rules):
+        """The subset of ``rules`` that can apply to this markup on first paint"""
+        kept = []
+        for prelude, body in rules:
+            if isinstance(body, list):
+                children = self.critical(body)
+                if children:
+                    kept.append((prelude, children))
+            elif prelude.startswith('@'):
+                continue
+            else:
+                selectors = [s for s in _split_top_level(prelude, ',') if self.matches(s)]
+                if selectors:
+                    kept.append((', '.join(selectors), body))
+        return kept
+
+
+class CSSPipeline:
+    """Builds css/style.min.css and the critical CSS of every template"""
+
+    def __init__(self, app):
+        self.app = app
+        self.source = os.path.join(app.static_folder, SOURCE)
+        self.output = os.path.join(app.static_folder, MINIFIED)
+        self.stylesheet = SOURCE
+        self._critical = {}
+        self._built_for = None
+        self._lock = threading.Lock()
+
+    def _template_folders(self):
+        folders = [os.path.join(self.app.root_path, self.app.template_folder)]
+        folders += [os.path.join(bp.root_path, bp.template_folder)
+                    for bp in self.app.blueprints.values() if bp.template_folder]
+        return folders
+
+    def _signature(self):
+        """Modification time and size of the stylesheet and every template"""
+        paths = [self.source]
+        for folder in self._template_folders():
+            for root, _, files in os.walk(folder):
+                paths.extend(os.path.join(root, name) for name in files)
+        signature = []
+        for path in sorted(paths):
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _markup(self, name, markup=None, seen=None):
+        markup = markup or TemplateMarkup()
+        seen = seen if seen is not None else set()
+        if name in seen:
+            return markup
+        seen.add(name)
+        env = self.app.jinja_env
+        source = env.loader.get_source(env, name)[0]
+        markup.add_source(source)
+        for dependency in _DEPENDENCY.findall(source):
+            self._markup(dependency, markup, seen)
+        return markup
+
+    def _write(self, minified):
+        # unchanged output keeps its mtime, so compressed siblings stay fresh
+        try:
+            with open(self.output, encoding='utf-8') as f:
+                if f.read() == minified:
+                    return
+        except OSError:
+            pass
+        # a name of our own, as every worker builds at startup
+        tmp = f'{self.output}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(minified)
+            os.replace(tmp, self.output)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def build(self):
+        """Write the minified stylesheet and recompute every template's critical CSS"""
+        with open(self.source, encoding='utf-8') as f:
+            rules = parse(f.read())
+        minified = minify(rules)
+        stylesheet = MINIFIED
+        try:
+            self._write(minified)
+        except OSError:
+            logger.exception("Could not write %s; serving %s", self.output, SOURCE)
+            stylesheet = SOURCE
+
+        critical = {}
+        for name in self.app.jinja_env.list_templates(extensions=['html']):
+            critical[name] = Markup(minify(self._markup(name).critical(rules)))
+        self.stylesheet, self._critical = stylesheet, critical
+        logger.info("Built %s (%d bytes, %d templates)", MINIFIED, len(minified), len(critical))
+
+    def refresh(self):
+        """Rebuild if the stylesheet or a template changed since the last build"""
+        signature = self._signature()
+        if signature == self._built_for:
+            return False
+        with self._lock:
+            if signature != self._built_for:
+                self.build()
+                self._built_for = signature
+        return True
+
+    def critical(self, template_name):
+        return self._critical.get(template_name) if CSS_CRITICAL_INLINE else None
+
+
+def _inject(app, template, context, **extra):
+    pipeline = app.extensions['css']
+    context['stylesheet'] = pipeline.stylesheet
+    context['critical_css'] = pipeline.critical(template.name)
+
+def _rebuild_in_debug():
+    if current_app.debug or CSS_AUTO_REBUILD:
+        current_app.extensions['css'].refresh()
+
+def init_app(app):
+    """Build the stylesheet and pass ``stylesheet``/``critical_css`` to every template"""
+    pipeline = CSSPipeline(app)
+    pipeline.refresh()
+    app.extensions['css'] = pipeline
+    before_render_template.connect(_inject, app)
+    app.before_request(_rebuild_in_debug)
+
+
+if __name__ == '__main__':
+    from flask import Flask
+    app = Flask(__name__)
+    pipeline = CSSPipeline(app)
+    pipeline.build()
+    print(f"Wrote {pipeline.output} ({os.path.getsize(pipeline.output)} bytes)")
+    for name, css in sorted(pipeline._critical.items()):
+        print(f"  {name:<28}{len(css):>7} bytes critical CSS")
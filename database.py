@@ -1,57 +1,368 @@
 # database.py - Database Connection Helper
-import mysql.connector
-from config import DB_CONFIG
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, request, session
+from config import (DB_BACKEND, DB_CONFIG, DB_POOL_CONFIG, DB_REPLICAS, SQLITE_CONFIG,
+                    READ_YOUR_WRITES_SECONDS, SLOW_QUERY_MS, SLOW_QUERY_LOG)
+from db_backends import create_backend, DatabaseError
 
-def get_db_connection():
-    """Create and return a database connection"""
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('slow_query')
+
+# Rows pulled from the server per round-trip by iter_query()
+STREAM_BATCH_SIZE = 500
+
+
+# ============ QUERY INSTRUMENTATION ============
+
+_query_stats = {}       # (endpoint, normalized sql) -> counters
+_query_stats_lock = threading.Lock()
+
+_literal_re = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b")
+_in_list_re = re.compile(r"IN\s*\((?:\s*(?:\?|%s)\s*,?)+\)", re.IGNORECASE)
+_space_re = re.compile(r"\s+")
+
+def normalize_sql(query):
+    """Collapse whitespace and replace literals so similar queries group together"""
+    query = _literal_re.sub('?', query)
+    query = _in_list_re.sub('IN (...)', query)
+    return _space_re.sub(' ', query).strip()
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return '<no request>'
+
+def record_query(query, duration, rowcount):
+    """Account one statement against the current request and the global stats"""
+    endpoint = _current_endpoint()
+    if has_app_context():
+        stats = g.setdefault('_db_stats', {'count': 0, 'time': 0.0, 'queries': []})
+        stats['count'] += 1
+        stats['time'] += duration
+        stats['queries'].append((query, duration, rowcount))
+
+    normalized = normalize_sql(query)
+    with _query_stats_lock:
+        entry = _query_stats.get((endpoint, normalized))
+        if entry is None:
+            entry = _query_stats[(endpoint, normalized)] = {
+                'endpoint': endpoint, 'sql': normalized,
+                'count': 0, 'total_time': 0.0, 'max_time': 0.0, 'rows': 0, 'slow': 0
+            }
+        entry['count'] += 1
+        entry['total_time'] += duration
+        entry['max_time'] = max(entry['max_time'], duration)
+        entry['rows'] += max(rowcount or 0, 0)
+        if duration * 1000 >= SLOW_QUERY_MS:
+            entry['slow'] += 1
+
+    if duration * 1000 >= SLOW_QUERY_MS:
+        slow_query_logger.warning("%.1fms rows=%s route=%s sql=%s",
+                                  duration * 1000, rowcount, endpoint, normalized)
+
+def record_error():
+    """Count a failed statement or connection against the current request"""
+    if has_app_context():
+        g._db_errors = g.get('_db_errors', 0) + 1
+
+def request_had_errors():
+    """True if a query in this request failed (its caller got None/empty data)"""
+    return has_app_context() and g.get('_db_errors', 0) > 0
+
+def request_query_stats():
+    """Query count, total time and statements recorded for this request"""
+    return g.get('_db_stats', {'count': 0, 'time': 0.0, 'queries': []})
+
+def top_queries(limit=20, order_by='total_time'):
+    """Heaviest (route, statement) pairs seen by this process"""
+    with _query_stats_lock:
+        entries = [dict(entry) for entry in _query_stats.values()]
+    for entry in entries:
+        entry['avg_time'] = entry['total_time'] / entry['count']
+    entries.sort(key=lambda entry: entry[order_by], reverse=True)
+    return entries[:limit]
+
+def reset_query_stats():
+    with _query_stats_lock:
+        _query_stats.clear()
+
+
+class TimedCursor:
+    """Cursor proxy that records every execute() through record_query()"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params or ())
+        finally:
+            record_query(query, time.perf_counter() - start, self._cursor.rowcount)
+
+    def executemany(self, query, seq_params):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, seq_params)
+        finally:
+            record_query(query, time.perf_counter() - start, self._cursor.rowcount)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the process-wide database backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(DB_BACKEND, DB_CONFIG, DB_POOL_CONFIG,
+                                          SQLITE_CONFIG, DB_REPLICAS)
+    return _backend
+
+def pool_stats():
+    """Counters per connection pool (checked out, waits, wait time...)"""
+    return get_backend().stats()
+
+def _has_replicas():
+    return bool(getattr(get_backend(), 'replicas', None))
+
+def reads_pinned_to_primary():
+    """True once this request or session has written (read-your-writes)"""
+    if not has_app_context():
+        return False
+    if g.get('_db_wrote'):
+        return True
+    if has_request_context():
+        wrote_at = session.get('_db_write_at')
+        return wrote_at is not None and time.time() - wrote_at < READ_YOUR_WRITES_SECONDS
+    return False
+
+def mark_write():
+    """Keep the rest of this request, and the session for a while, on the primary"""
+    if not _has_replicas() or not has_app_context():
+        return
+    g._db_wrote = True
+    if has_request_context():
+        session['_db_write_at'] = time.time()
+
+def get_db_connection(readonly=False):
+    """Return a pooled database connection.
+
+    Inside a Flask app context the connection is kept on ``g`` and reused
+    by every query in that request; it goes back to the pool on teardown.
+    ``readonly`` connections come from a replica when replicas are
+    configured and the session has not written recently.
+    """
+    backend = get_backend()
+    readonly = readonly and _has_replicas() and not reads_pinned_to_primary()
+    key = '_db_read_conn' if readonly else '_db_conn'
     try:
-        conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Database Error: {err}")
+        if has_app_context():
+            if key not in g:
+                setattr(g, key, backend.acquire(readonly=readonly))
+            return g.get(key)
+        return backend.acquire(readonly=readonly)
+    except backend.errors as err:
+        logger.error("Database Error: %s", err)
+        record_error()
         return None
 
-def execute_query(query, params=None, fetch=False):
-    """Execute a query and optionally fetch results"""
+def release_db_connection(conn):
+    """Give back a connection from get_db_connection()"""
+    if has_app_context() and (g.get('_db_conn') is conn or g.get('_db_read_conn') is conn):
+        return
+    get_backend().release(conn)
+
+def close_db(exc=None):
+    """Return the request's connections to their pools"""
+    for key in ('_db_conn', '_db_read_conn'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            get_backend().release(conn)
+
+def add_server_timing(response):
+    """Expose the request's database cost as a Server-Timing header"""
+    stats = request_query_stats()
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats["time"] * 1000:.1f};desc="{stats["count"]} queries"'
+    )
+    return response
+
+def init_app(app):
+    """Register per-request connection handling and instrumentation"""
+    app.teardown_appcontext(close_db)
+    app.after_request(add_server_timing)
+
+    if SLOW_QUERY_LOG and not slow_query_logger.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.WARNING)
+
+@contextmanager
+def transaction():
+    """Run a group of statements on one connection with a single commit.
+
+    Yields a dictionary cursor. The transaction is committed when the block
+    exits normally and rolled back if it raises; database errors are
+    re-raised as DatabaseError after the rollback. Nested calls join the
+    transaction that is already open on the request's connection.
+    """
+    backend = get_backend()
     conn = get_db_connection()
+    if conn is None:
+        raise DatabaseError("No database connection")
+
+    cursor = TimedCursor(backend.cursor(conn))
+    if conn.in_transaction:
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+        return
+
+    try:
+        mark_write()
+        backend.begin(conn)
+        yield cursor
+        conn.commit()
+    except BaseException as err:
+        try:
+            conn.rollback()
+        except backend.errors:
+            pass
+        if isinstance(err, backend.errors) and not isinstance(err, DatabaseError):
+            logger.error("Transaction Error: %s", err)
+            record_error()
+            raise DatabaseError(str(err)) from err
+        raise
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+def _open_cursor(conn, query, prepared, dictionary=True):
+    if prepared:
+        return get_backend().prepared_cursor(conn, query, dictionary)
+    return get_backend().cursor(conn, dictionary)
+
+def execute_query(query, params=None, fetch=False, prepared=False, row_factory=None):
+    """Execute a query and optionally fetch results.
+
+    With ``prepared=True`` the statement is prepared once and its handle
+    is cached on the connection for reuse (MySQL binary protocol; SQLite
+    caches statements on its own). With a ``row_factory`` rows are read as
+    plain tuples and each one is passed through it instead of being
+    turned into a dict.
+    """
+    conn = get_db_connection(readonly=fetch)
     if conn is None:
         return None
-    
-    cursor = conn.cursor(dictionary=True)
+
+    cursor = _open_cursor(conn, query, prepared, row_factory is None)
+    start = time.perf_counter()
     try:
         cursor.execute(query, params or ())
         if fetch:
             result = cursor.fetchall()
+            rowcount = len(result)
+            if row_factory is not None:
+                result = [row_factory(row) for row in result]
         else:
             conn.commit()
+            mark_write()
             result = cursor.lastrowid
+            rowcount = cursor.rowcount
+        record_query(query, time.perf_counter() - start, rowcount)
         return result
-    except mysql.connector.Error as err:
-        print(f"Query Error: {err}")
+    except get_backend().errors as err:
+        logger.error("Query Error: %s", err)
+        record_error()
+        if prepared:
+            get_backend().discard_statement(conn, query)
         return None
     finally:
-        cursor.close()
-        conn.close()
+        if not prepared:
+            cursor.close()
+        release_db_connection(conn)
 
-def execute_one(query, params=None):
-    """Execute query and fetch one result"""
-    conn = get_db_connection()
+def execute_one(query, params=None, prepared=False, row_factory=None):
+    """Execute query and fetch one result (routed like a read)"""
+    conn = get_db_connection(readonly=True)
     if conn is None:
         return None
-    
-    cursor = conn.cursor(dictionary=True)
+
+    cursor = _open_cursor(conn, query, prepared, row_factory is None)
+    start = time.perf_counter()
     try:
         cursor.execute(query, params or ())
-        result = cursor.fetchone()
-        return result
-    except mysql.connector.Error as err:
-        print(f"Query Error: {err}")
+        # Drain the result so a cached prepared cursor is left reusable
+        rows = cursor.fetchall()
+        record_query(query, time.perf_counter() - start, len(rows))
+        if not rows:
+            return None
+        return rows[0] if row_factory is None else row_factory(rows[0])
+    except get_backend().errors as err:
+        logger.error("Query Error: %s", err)
+        record_error()
+        if prepared:
+            get_backend().discard_statement(conn, query)
         return None
     finally:
-        cursor.close()
-        conn.close()
+        if not prepared:
+            cursor.close()
+        release_db_connection(conn)
+
+def iter_query(query, params=None, batch_size=STREAM_BATCH_SIZE, row_factory=None):
+    """Yield result rows one by one without loading the whole result.
+
+    Runs on a dedicated connection (a pooled one on MySQL, a short-lived
+    one on SQLite) with an unbuffered cursor so the request's own
+    connection stays usable while the rows are consumed, e.g. by a
+    streamed template. Rows are fetched in batches of ``batch_size``; a
+    generator closed early drops its MySQL connection instead of reading
+    the remaining rows. ``row_factory`` works as in execute_query().
+    """
+    backend = get_backend()
+    readonly = _has_replicas() and not reads_pinned_to_primary()
+    try:
+        conn = backend.acquire(readonly=readonly)
+    except backend.errors as err:
+        logger.error("Database Error: %s", err)
+        record_error()
+        return
+
+    cursor = backend.stream_cursor(conn, row_factory is None)
+    start = time.perf_counter()
+    rowcount = 0
+    exhausted = False
+    try:
+        cursor.execute(query, params or ())
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            rowcount += len(rows)
+            if row_factory is None:
+                yield from rows
+            else:
+                yield from map(row_factory, rows)
+        exhausted = True
+    except backend.errors as err:
+        logger.error("Query Error: %s", err)
+        record_error()
+    finally:
+        record_query(query, time.perf_counter() - start, rowcount)
+        backend.close_stream(conn, cursor, exhausted)
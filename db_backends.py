@@ -0,0 +1,558 @@
+# db_backends.py - Database backends (MySQL pool, embedded SQLite)
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+import mysql.connector
+
+# Prepared statements kept open per pooled connection
+STATEMENT_CACHE_SIZE = 32
+
+# Unique key used as the conflict target when an ON DUPLICATE KEY UPDATE
+# statement is translated to SQLite's ON CONFLICT ... DO UPDATE
+UPSERT_KEYS = {
+    'site_content': 'content_key',
+    'stat_counters': 'name',
+    'daily_signups': 'day',
+    'cache_versions': 'name',
+    'session_revocations': 'user_id',
+    'rate_limits': 'limit_key'
+}
+
+
+class DatabaseError(Exception):
+    """Raised by the database layer regardless of the backend in use"""
+
+
+class PoolTimeout(DatabaseError):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of MySQL connections.
+
+    Keeps up to ``pool_size`` idle connections around and allows up to
+    ``max_overflow`` extra ones under load. Connections older than
+    ``recycle`` seconds are replaced, and idle connections are pinged
+    before being handed out when ``pre_ping`` is enabled.
+    """
+
+    def __init__(self, db_config, pool_size=5, max_overflow=10, timeout=30,
+                 recycle=3600, pre_ping=True):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = []          # most recently used last
+        self._born = {}          # id(conn) -> created_at
+        self._statements = {}    # id(conn) -> OrderedDict((sql, dictionary) -> prepared cursor)
+        self._open = 0
+        self._checked_out = 0
+
+        # counters for pool_stats()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._prepares = 0
+        self._statement_hits = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(
+            host=self.db_config['host'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            database=self.db_config['database'],
+            port=self.db_config.get('port') or 3306,
+            autocommit=True
+        )
+        with self._cond:
+            self._created += 1
+            self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _close(self, conn):
+        self._born.pop(id(conn), None)
+        for cursor in self._statements.pop(id(conn), {}).values():
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if allowed"""
+        conn = None
+        wait_start = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.pool_size + self.max_overflow:
+                    self._open += 1
+                    break
+                if wait_start is None:
+                    wait_start = time.monotonic()
+                    self._waits += 1
+                remaining = self.timeout - (time.monotonic() - wait_start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += time.monotonic() - wait_start
+                    raise PoolTimeout(f"Connection pool exhausted after {self.timeout}s")
+                self._cond.wait(remaining)
+            if wait_start is not None:
+                self._wait_time += time.monotonic() - wait_start
+            self._checked_out += 1
+            self._checkouts += 1
+
+        try:
+            if conn is None:
+                return self._connect()
+            return self._validate(conn)
+        except mysql.connector.Error:
+            with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+
+    def _validate(self, conn):
+        """Recycle old connections and ping idle ones before reuse"""
+        born = self._born.get(id(conn), 0)
+        if self.recycle and time.monotonic() - born > self.recycle:
+            self._close(conn)
+            with self._cond:
+                self._recycled += 1
+            return self._connect()
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except mysql.connector.Error:
+                self._close(conn)
+                with self._cond:
+                    self._ping_failures += 1
+                return self._connect()
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, closing it if not reusable"""
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except mysql.connector.Error:
+                discard = True
+        with self._cond:
+            self._checked_out -= 1
+            if discard or len(self._idle) >= self.pool_size:
+                self._open -= 1
+                self._close(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def prepared_cursor(self, conn, query, dictionary=True):
+        """Return a prepared cursor for ``query`` cached on ``conn``.
+
+        The statement is prepared by the server on its first execution and
+        the handle is kept for as long as the pooled connection lives, so
+        later checkouts skip the parse/plan step. The cache is bounded per
+        connection; the least recently used statement is closed first.
+        """
+        key = (query, dictionary)
+        cache = self._statements.setdefault(id(conn), OrderedDict())
+        cursor = cache.get(key)
+        if cursor is not None:
+            cache.move_to_end(key)
+            with self._cond:
+                self._statement_hits += 1
+            return cursor
+
+        cursor = conn.cursor(prepared=True, dictionary=dictionary)
+        cache[key] = cursor
+        with self._cond:
+            self._prepares += 1
+        if len(cache) > STATEMENT_CACHE_SIZE:
+            _, oldest = cache.popitem(last=False)
+            try:
+                oldest.close()
+            except mysql.connector.Error:
+                pass
+        return cursor
+
+    def discard_statement(self, conn, query):
+        """Drop the cached prepared cursors for ``query``, e.g. after an error"""
+        cache = self._statements.get(id(conn), {})
+        for dictionary in (True, False):
+            cursor = cache.pop((query, dictionary), None)
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except mysql.connector.Error:
+                    pass
+
+    def dispose(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            for conn in idle:
+                self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time': round(self._wait_time, 4),
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'recycled': self._recycled,
+                'ping_failures': self._ping_failures,
+                'statements_prepared': self._prepares,
+                'statement_cache_hits': self._statement_hits
+            }
+
+
+class Replica:
+    """A read replica's pool plus its routing weight and health"""
+
+    def __init__(self, name, pool, weight=1):
+        self.name = name
+        self.pool = pool
+        self.weight = max(weight, 1)
+        self.down_until = 0.0
+
+    def load(self):
+        return (self.pool.stats()['checked_out'] + 1) / self.weight
+
+
+class MySQLBackend:
+    """MySQL primary reached through a ConnectionPool, plus optional replicas.
+
+    Read-only checkouts go to the replica with the lowest weighted load
+    (checked-out connections / weight); a replica that fails to hand out a
+    connection is skipped for ``replica_retry`` seconds and reads fall back
+    to the primary when none is available.
+    """
+
+    name = 'mysql'
+    errors = (mysql.connector.Error, DatabaseError)
+    IntegrityError = mysql.connector.IntegrityError
+
+    def __init__(self, db_config, pool_config, replicas=(), replica_retry=30):
+        self.pool = ConnectionPool(db_config, **pool_config)
+        self.replicas = [
+            Replica(f"{replica['host']}:{replica['port']}",
+                    ConnectionPool(dict(db_config, host=replica['host'], port=replica['port']),
+                                   **pool_config),
+                    replica['weight'])
+            for replica in replicas
+        ]
+        self.replica_retry = replica_retry
+        self._owners = {}        # id(conn) -> pool it was checked out from
+        self._lock = threading.Lock()
+        self._replica_reads = 0
+        self._replica_fallbacks = 0
+
+    def _pick_replicas(self):
+        now = time.monotonic()
+        healthy = [replica for replica in self.replicas if replica.down_until <= now]
+        return sorted(healthy, key=lambda replica: (replica.load(), random.random()))
+
+    def acquire(self, readonly=False):
+        if readonly and self.replicas:
+            for replica in self._pick_replicas():
+                try:
+                    conn = replica.pool.acquire()
+                except self.errors:
+                    replica.down_until = time.monotonic() + self.replica_retry
+                    continue
+                with self._lock:
+                    self._owners[id(conn)] = replica.pool
+                    self._replica_reads += 1
+                return conn
+            with self._lock:
+                self._replica_fallbacks += 1
+
+        conn = self.pool.acquire()
+        with self._lock:
+            self._owners[id(conn)] = self.pool
+        return conn
+
+    def _owner(self, conn):
+        return self._owners.get(id(conn), self.pool)
+
+    def release(self, conn, discard=False):
+        with self._lock:
+            pool = self._owners.pop(id(conn), self.pool)
+        pool.release(conn, discard)
+
+    def cursor(self, conn, dictionary=True):
+        return conn.cursor(dictionary=dictionary, buffered=True)
+
+    def stream_cursor(self, conn, dictionary=True):
+        """Unbuffered cursor: rows stay on the server until fetched"""
+        return conn.cursor(dictionary=dictionary, buffered=False)
+
+    def close_stream(self, conn, cursor, exhausted):
+        """Release a streaming connection, dropping it if rows were left unread"""
+        try:
+            cursor.close()
+        except self.errors:
+            exhausted = False
+        self.release(conn, discard=not exhausted)
+
+    def prepared_cursor(self, conn, query, dictionary=True):
+        return self._owner(conn).prepared_cursor(conn, query, dictionary)
+
+    def discard_statement(self, conn, query):
+        self._owner(conn).discard_statement(conn, query)
+
+    def begin(self, conn):
+        conn.start_transaction()
+
+    def is_already_exists(self, err):
+        """Table, column or index being created is already there"""
+        return getattr(err, 'errno', None) in (1050, 1060, 1061)
+
+    def translate(self, query):
+        return query
+
+    def stats(self):
+        """Counters per pool, keyed by 'primary' and 'replica <host:port>'"""
+        stats = {'primary': self.pool.stats()}
+        for replica in self.replicas:
+            replica_stats = replica.pool.stats()
+            replica_stats['weight'] = replica.weight
+            replica_stats['down'] = replica.down_until > time.monotonic()
+            stats[f'replica {replica.name}'] = replica_stats
+        if self.replicas:
+            with self._lock:
+                stats['primary']['replica_reads'] = self._replica_reads
+                stats['primary']['replica_fallbacks'] = self._replica_fallbacks
+        return stats
+
+
+# ============ SQLITE ============
+
+_interval_re = re.compile(
+    r"DATE_(SUB|ADD)\(\s*NOW\(\)\s*,\s*INTERVAL\s+(\d+|%s)\s+(SECOND|MINUTE|HOUR|DAY)\s*\)",
+    re.IGNORECASE
+)
+_now_re = re.compile(r"\bNOW\(\)", re.IGNORECASE)
+_upsert_re = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE)
+_insert_table_re = re.compile(r"INSERT\s+(?:IGNORE\s+)?INTO\s+(\w+)", re.IGNORECASE)
+_values_fn_re = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+_insert_ignore_re = re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE)
+_for_update_re = re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE)
+_auto_pk_re = re.compile(r"\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.IGNORECASE)
+_enum_re = re.compile(r"\bENUM\s*\([^)]*\)", re.IGNORECASE)
+_on_update_re = re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", re.IGNORECASE)
+_default_now_re = re.compile(r"\bDEFAULT\s+CURRENT_TIMESTAMP\b", re.IGNORECASE)
+
+SQLITE_NOW = "datetime('now', 'localtime')"
+
+
+def _interval_sql(match):
+    sign = '-' if match.group(1).upper() == 'SUB' else '+'
+    amount, unit = match.group(2), match.group(3).lower()
+    if amount == '%s':
+        return f"datetime('now', 'localtime', '{sign}' || ? || ' {unit}s')"
+    return f"datetime('now', 'localtime', '{sign}{amount} {unit}s')"
+
+
+@lru_cache(maxsize=512)
+def translate_sqlite(query):
+    """Rewrite the MySQL dialect used in this app into SQLite SQL.
+
+    Only the constructs the app actually uses are handled: %s placeholders,
+    NOW()/DATE_SUB/DATE_ADD intervals, ON DUPLICATE KEY UPDATE, INSERT IGNORE,
+    FOR UPDATE and the column types used by the schema.
+    """
+    query = _interval_re.sub(_interval_sql, query)
+    query = _now_re.sub(SQLITE_NOW, query)
+
+    if _upsert_re.search(query):
+        table = _insert_table_re.search(query).group(1)
+        query = _upsert_re.sub(f"ON CONFLICT({UPSERT_KEYS[table]}) DO UPDATE SET", query)
+        query = _values_fn_re.sub(r"excluded.\1", query)
+
+    query = _insert_ignore_re.sub('INSERT OR IGNORE', query)
+    query = _for_update_re.sub('', query)
+
+    # DDL
+    query = _auto_pk_re.sub('INTEGER PRIMARY KEY AUTOINCREMENT', query)
+    query = _enum_re.sub('TEXT', query)
+    query = _on_update_re.sub('', query)
+    query = _default_now_re.sub(f"DEFAULT ({SQLITE_NOW})", query)
+
+    return query.replace('%s', '?')
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts the app's MySQL-flavoured SQL"""
+
+    def __init__(self, conn, dictionary=True):
+        self._cursor = conn.cursor()
+        if not dictionary:
+            self._cursor.row_factory = None
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate_sqlite(query), params)
+        return self
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(translate_sqlite(query), seq_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class SQLiteBackend:
+    """Embedded SQLite database with one connection per thread.
+
+    iter_query() streams get a short-lived connection of their own.
+
+    Connections run in autocommit mode with WAL journaling so readers never
+    block the writer; transaction() issues an explicit BEGIN IMMEDIATE.
+    sqlite3 keeps its own per-connection statement cache, so prepared
+    cursors need no extra bookkeeping here.
+    """
+
+    name = 'sqlite'
+    errors = (sqlite3.Error, DatabaseError)
+    IntegrityError = sqlite3.IntegrityError
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._checkouts = 0
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, cached_statements=256)
+        conn.row_factory = _dict_row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+        with self._lock:
+            self._opened += 1
+        return conn
+
+    def acquire(self, readonly=False):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        with self._lock:
+            self._checkouts += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        if conn.in_transaction:
+            conn.rollback()
+        if discard:
+            conn.close()
+            self._local.conn = None
+
+    def cursor(self, conn, dictionary=True):
+        return SQLiteCursor(conn, dictionary)
+
+    def stream_cursor(self, conn, dictionary=True):
+        # the thread's connection is the request's own; under WAL a second
+        # connection reads alongside it without blocking its writes
+        cursor = SQLiteCursor(self._connect(), dictionary)
+        cursor.connection = cursor._cursor.connection
+        return cursor
+
+    def close_stream(self, conn, cursor, exhausted):
+        cursor.close()
+        cursor.connection.close()
+
+    def prepared_cursor(self, conn, query, dictionary=True):
+        return SQLiteCursor(conn, dictionary)
+
+    def discard_statement(self, conn, query):
+        pass
+
+    def begin(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+
+    def is_already_exists(self, err):
+        message = str(err)
+        return 'already exists' in message or 'duplicate column name' in message
+
+    def translate(self, query):
+        return translate_sqlite(query)
+
+    def stats(self):
+        with self._lock:
+            return {'sqlite': {
+                'path': self.path,
+                'connections_opened': self._opened,
+                'checkouts': self._checkouts
+            }}
+
+
+def create_backend(name, db_config, pool_config, sqlite_config, replicas=()):
+    """Build the backend selected by DB_BACKEND"""
+    if name == 'mysql':
+        return MySQLBackend(db_config, pool_config, replicas)
+    if name == 'sqlite':
+        return SQLiteBackend(sqlite_config['path'], sqlite_config['timeout'])
+    raise ValueError(f"Unknown DB_BACKEND: {name}")
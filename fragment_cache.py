@@ -0,0 +1,39 @@
+# fragment_cache.py - {% cache %} tag for caching rendered template fragments
+#
+#     {% cache u.id, u.row_version %} ...row markup... {% endcache %}
+#
+# The body is rendered once per distinct key (plus the template name) and
+# kept in a bounded LRU store shared by all templates of the app. Keys
+# should contain everything the fragment depends on, typically the row id
+# and a version that changes whenever the row does.
+from jinja2 import nodes
+from jinja2.ext import Extension
+from config import FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_TTL
+from cache import LRUBackend
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUBackend(maxsize=FRAGMENT_CACHE_SIZE,
+                                                     ttl=FRAGMENT_CACHE_TTL))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [nodes.Const(parser.name)]
+        key.append(parser.parse_expression())
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.Tuple(key, 'load')]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        store = self.environment.fragment_cache
+        fragment = store.get(key)
+        if fragment is None:
+            fragment = caller()
+            store.set(key, fragment)
+        return fragment
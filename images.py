@@ -0,0 +1,112 @@
+# images.py - Validation and resized variants for uploaded images
+#
+# An upload is streamed to a temporary file, decoded to check that it is
+# really a PNG or JPEG image, and then handed to a small worker pool that
+# writes square WebP and PNG variants (images/<name>-<width>.<ext>). Each
+# file is written under a temporary name and moved into place with
+# os.replace(), so a page never links a half-written image.
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import IMAGE_VARIANT_WIDTHS, IMAGE_WORKERS, IMAGE_MAX_PIXELS, IMAGE_WEBP_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# Formats accepted by validate_image(), as reported by Pillow
+IMAGE_FORMATS = {'PNG', 'JPEG'}
+
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='images')
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def save_upload(file, folder):
+    """Stream an uploaded file to a temporary path in ``folder``"""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'.upload-{uuid.uuid4().hex}.tmp')
+    file.save(path)
+    return path
+
+def validate_image(path):
+    """Decode the file's header and structure; raises InvalidImage"""
+    try:
+        with Image.open(path) as img:
+            if img.format not in IMAGE_FORMATS:
+                raise InvalidImage(f"Unsupported image format: {img.format}")
+            img.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as err:
+        raise InvalidImage(str(err)) from err
+
+def variant_name(name, width, ext):
+    return f'images/{name}-{width}.{ext}'
+
+def _write_atomic(img, path, **options):
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        img.save(tmp, **options)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def build_variants(source, static_folder, name, fallback=None):
+    """Write every width of ``source`` as WebP and PNG; returns the files written.
+
+    ``fallback`` (e.g. 'images/profile.png') is replaced with the largest
+    PNG variant for pages that still link the plain file.
+    """
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        written = []
+        for width in IMAGE_VARIANT_WIDTHS:
+            variant = ImageOps.fit(img, (width, width), Image.LANCZOS)
+            for ext, options in (('webp', {'format': 'WEBP', 'quality': IMAGE_WEBP_QUALITY, 'method': 6}),
+                                 ('png', {'format': 'PNG', 'optimize': True})):
+                filename = variant_name(name, width, ext)
+                _write_atomic(variant, os.path.join(static_folder, filename), **options)
+                written.append(filename)
+        if fallback:
+            largest = ImageOps.fit(img, (IMAGE_VARIANT_WIDTHS[-1],) * 2, Image.LANCZOS)
+            _write_atomic(largest, os.path.join(static_folder, fallback), format='PNG', optimize=True)
+            written.append(fallback)
+    return written
+
+def process_async(source, static_folder, name, fallback=None, on_done=None, remove_source=True):
+    """Build the variants in the worker pool; ``on_done(files)`` runs after the swap"""
+    def job():
+        try:
+            files = build_variants(source, static_folder, name, fallback)
+            if on_done is not None:
+                on_done(files)
+        except Exception:
+            logger.exception("Building image variants of %s failed", name)
+        finally:
+            if remove_source and os.path.exists(source):
+                os.remove(source)
+    return _pool.submit(job)
+
+
+class ResponsiveImage:
+    """URLs for <picture>/srcset markup of one image name"""
+
+    def __init__(self, name, static_url, exists):
+        self.src = static_url(f'images/{name}.png')
+        self.webp_srcset = self._srcset(name, 'webp', static_url, exists)
+        self.png_srcset = self._srcset(name, 'png', static_url, exists)
+        if self.png_srcset:
+            self.src = static_url(variant_name(name, IMAGE_VARIANT_WIDTHS[0], 'png'))
+
+    @staticmethod
+    def _srcset(name, ext, static_url, exists):
+        base = IMAGE_VARIANT_WIDTHS[0]
+        return ', '.join(f'{static_url(variant_name(name, width, ext))} {width / base:g}x'
+                         for width in IMAGE_VARIANT_WIDTHS
+                         if exists(variant_name(name, width, ext)))
@@ -0,0 +1,148 @@
+# maintenance.py - Background jobs (expired-row reaper) and their CLI
+#
+# Usage: python maintenance.py purge [--batch-size N] [--pause SECONDS]
+#        python maintenance.py reconcile-stats
+import logging
+import threading
+import time
+from dotenv import load_dotenv
+load_dotenv()
+from config import (OTP_EXPIRY_MINUTES, PENDING_REGISTRATION_RETENTION_HOURS,
+                    MAINTENANCE_ENABLED, PURGE_INTERVAL_SECONDS, PURGE_BATCH_SIZE,
+                    PURGE_BATCH_PAUSE, STATS_RECONCILE_SECONDS, SESSION_LIFETIME_DAYS)
+from database import execute_query
+import stats
+
+logger = logging.getLogger(__name__)
+
+# table -> (timestamp column, retention in minutes)
+PURGE_RULES = {
+    'otp_codes': ('created_at', OTP_EXPIRY_MINUTES),
+    'pending_registrations': ('created_at', PENDING_REGISTRATION_RETENTION_HOURS * 60),
+    'rate_limits': ('expires_at', 0),
+    # snapshots issued before a revocation this old have expired anyway
+    'session_revocations': ('updated_at', SESSION_LIFETIME_DAYS * 24 * 60)
+}
+
+# ============ REAPER ============
+
+def purge_table(table, batch_size=PURGE_BATCH_SIZE, pause=PURGE_BATCH_PAUSE):
+    """Delete rows of ``table`` older than its retention, one batch at a time.
+
+    Each batch selects a bounded set of ids through the timestamp index and
+    deletes them by primary key, so locks are short and held on few rows;
+    ``pause`` seconds between batches leaves room for request traffic.
+    Returns the number of rows deleted.
+    """
+    column, minutes = PURGE_RULES[table]
+    select_query = f"""
+        SELECT id FROM {table}
+        WHERE {column} < DATE_SUB(NOW(), INTERVAL %s MINUTE)
+        ORDER BY {column} LIMIT %s
+    """
+    purged = 0
+    while True:
+        rows = execute_query(select_query, (minutes, batch_size), fetch=True)
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        placeholders = ', '.join(['%s'] * len(ids))
+        if execute_query(f"DELETE FROM {table} WHERE id IN ({placeholders})", tuple(ids)) is None:
+            break  # query error, already logged
+        purged += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    return purged
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE, pause=PURGE_BATCH_PAUSE):
+    """Purge every table in PURGE_RULES and report rows deleted per table"""
+    start = time.perf_counter()
+    report = {table: purge_table(table, batch_size, pause) for table in PURGE_RULES}
+    logger.info("Purged expired rows in %.2fs: %s", time.perf_counter() - start, report)
+    return report
+
+# ============ SCHEDULER ============
+
+class Scheduler:
+    """Runs registered jobs periodically on one daemon thread"""
+
+    def __init__(self):
+        self._jobs = []          # [name, interval, func, next_run]
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_results = {}   # name -> (finished_at, result or exception)
+
+    def add_job(self, name, interval, func):
+        self._jobs.append([name, interval, func, time.monotonic() + interval])
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for job in self._jobs:
+                name, interval, func, next_run = job
+                if next_run > now:
+                    continue
+                try:
+                    result = func()
+                except Exception as err:
+                    logger.exception("Maintenance job %s failed", name)
+                    result = err
+                self.last_results[name] = (time.time(), result)
+                job[3] = time.monotonic() + interval
+            next_due = min((job[3] for job in self._jobs), default=now + 60)
+            self._stop.wait(max(next_due - time.monotonic(), 0.1))
+
+
+scheduler = Scheduler()
+
+def init_app(app):
+    """Run the maintenance jobs in each worker that serves requests.
+
+    The scheduler thread starts on the first request, so the debug
+    reloader's parent process and one-off imports never run it. Disable
+    with MAINTENANCE_ENABLED=False when the purge runs from cron instead.
+    """
+    if not MAINTENANCE_ENABLED:
+        return
+    scheduler.add_job('purge_expired', PURGE_INTERVAL_SECONDS, purge_expired)
+    scheduler.add_job('reconcile_stats', STATS_RECONCILE_SECONDS, stats.reconcile)
+    app.before_request(scheduler.start)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Database maintenance tasks')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    purge = subcommands.add_parser('purge', help='delete expired OTPs, pending registrations, rate limits and session revocations')
+    purge.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+    purge.add_argument('--pause', type=float, default=PURGE_BATCH_PAUSE)
+    subcommands.add_parser('reconcile-stats', help='recompute the admin dashboard statistics')
+    args = parser.parse_args()
+
+    if args.command == 'purge':
+        report = purge_expired(args.batch_size, args.pause)
+        for table, purged in report.items():
+            print(f"{table}: {purged} rows purged")
+    elif args.command == 'reconcile-stats':
+        drift = stats.reconcile()
+        for name, correction in drift.items():
+            print(f"{name}: corrected by {correction:+d}")
+        print("Statistics are up to date." if not drift else f"{len(drift)} values corrected.")
@@ -1,11 +1,84 @@
 # models.py - User Model and Database Operations
-from database import execute_query, execute_one
+from database import execute_query, execute_one, iter_query, transaction, DatabaseError
+from config import (OTP_EXPIRY_MINUTES, HOMEPAGE_CACHE_TTL,
+                    USER_CACHE_BACKEND, USER_CACHE_SIZE, USER_CACHE_TTL)
 from datetime import datetime
-import hashlib
+from functools import lru_cache
+import stats
+import user_sessions
+from cache import TTLCache, ObjectCache, bump_version, create_backend as create_cache_backend
+import passwords
+from passwords import hash_password
 
-def hash_password(password):
-    """Simple password hashing"""
-    return hashlib.sha256(password.encode()).hexdigest()
+# ============ USER ROWS ============
+
+class User:
+    """Compact user row.
+
+    Only the columns of the projection it was loaded with are set; the
+    others raise KeyError/AttributeError rather than silently reading
+    data that was never fetched. Supports both ``user.id`` and
+    ``user['id']`` so templates and older dict-style code keep working.
+    """
+
+    __slots__ = ('id', 'username', 'password', 'email', 'firstname', 'middlename',
+                 'lastname', 'birthday', 'contact', 'role', 'is_active', 'created_at',
+                 'session_version', 'row_version')
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+    def __repr__(self):
+        return f"<User {self.to_dict()!r}>"
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def row_factory(columns):
+        """Build a function turning a tuple row with ``columns`` into a User"""
+        setters = [getattr(User, name).__set__ for name in columns]
+        new = User.__new__
+
+        def factory(row):
+            user = new(User)
+            for setter, value in zip(setters, row):
+                setter(user, value)
+            return user
+        return factory
+
+# Per-use-case projections: fetch only what the caller renders or checks
+USER_KEY_COLUMNS = ('id', 'username', 'email')
+# What login() copies into the session snapshot (see user_sessions.py)
+USER_SESSION_COLUMNS = ('id', 'username', 'email', 'firstname', 'middlename', 'lastname',
+                        'birthday', 'contact', 'role', 'session_version')
+USER_AUTH_COLUMNS = USER_SESSION_COLUMNS + ('password', 'is_active')
+USER_NAVBAR_COLUMNS = ('id', 'username', 'firstname', 'lastname', 'role')
+USER_PUBLIC_COLUMNS = ('id', 'firstname', 'lastname', 'email', 'birthday')
+USER_PROFILE_COLUMNS = ('id', 'username', 'email', 'firstname', 'middlename', 'lastname',
+                        'birthday', 'contact', 'role', 'is_active', 'created_at')
+# row_version keys the cached table-row fragments ({% cache %} in the templates)
+USER_ADMIN_ROW_COLUMNS = ('id', 'username', 'email', 'firstname', 'middlename', 'lastname',
+                          'contact', 'role', 'is_active', 'created_at', 'row_version')
+
+# Users by id (and username/email aliases), one entry per projection.
+# Every user write bumps the 'users' version and invalidates the ids it touched.
+USERS_CACHE = 'users'
+user_cache = ObjectCache(USERS_CACHE, create_cache_backend(
+    USER_CACHE_BACKEND, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL))
+
+def _select_users(columns):
+    return f"SELECT {', '.join(columns)} FROM users"
 
 # ============ USER OPERATIONS ============
 
@@ -20,125 +93,402 @@ def create_user(username, password, email, firstname, middlename, lastname,
     """
     params = (username, hashed_pw, email, firstname, middlename, lastname, 
               birthday, contact, role)
-    return execute_query(query, params)
+    try:
+        with transaction() as cursor:
+            cursor.execute(query, params)
+            stats.record_created(cursor, 1, admins=int(role == 'admin'))
+            user_id = cursor.lastrowid
+    except DatabaseError:
+        return None
+    user_cache.invalidate(user_id)
+    return user_id
 
-def get_user_by_username(username):
-    """Get user by username"""
-    query = "SELECT * FROM users WHERE username = %s"
-    return execute_one(query, (username,))
+# ============ BULK USER OPERATIONS ============
 
-def get_user_by_email(email):
-    """Get user by email"""
-    query = "SELECT * FROM users WHERE email = %s"
-    return execute_one(query, (email,))
+# Values per IN (...) list / rows per executemany batch
+BULK_CHUNK_SIZE = 1000
+
+def _chunks(items, size=BULK_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _find_existing(column, values):
+    existing = set()
+    for chunk in _chunks(values):
+        placeholders = ', '.join(['%s'] * len(chunk))
+        query = f"SELECT {column} FROM users WHERE {column} IN ({placeholders})"
+        rows = execute_query(query, tuple(chunk), fetch=True) or []
+        existing.update(row[column] for row in rows)
+    return existing
 
-def get_user_by_id(user_id):
-    """Get user by ID"""
-    query = "SELECT * FROM users WHERE id = %s"
-    return execute_one(query, (user_id,))
+def find_existing_usernames(usernames):
+    """Return which of ``usernames`` are already taken (one query per chunk)"""
+    return _find_existing('username', usernames)
+
+def find_existing_emails(emails):
+    """Return which of ``emails`` are already registered (one query per chunk)"""
+    return _find_existing('email', emails)
+
+def bulk_create_users(users):
+    """Insert many users in one transaction with batched executemany.
+
+    ``users`` is a list of (username, password, email, firstname,
+    middlename, lastname, birthday, contact, role, password_hash) tuples.
+    Rows with a password_hash (see passwords.is_stored_hash) are stored
+    as is; the others have their plain-text password hashed, which costs
+    as much as a login per row. Nothing is inserted if any batch fails.
+    Returns the number of users created, or None on error.
+    """
+    query = """
+        INSERT INTO users (username, password, email, firstname, middlename, 
+                          lastname, birthday, contact, role, is_active, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 1, NOW())
+    """
+    # hash before the transaction so its locks aren't held while hashing
+    batches = []
+    for chunk in _chunks(users):
+        hashes = iter(passwords.hash_passwords([user[1] for user in chunk if not user[9]]))
+        batches.append([(user[0], user[9] or next(hashes)) + tuple(user[2:9])
+                        for user in chunk])
+    created = 0
+    try:
+        with transaction() as cursor:
+            for rows in batches:
+                cursor.executemany(query, rows)
+                created += len(rows)
+            stats.record_created(cursor, created,
+                                 admins=sum(1 for user in users if user[8] == 'admin'))
+    except DatabaseError:
+        return None
+    return created
+
+def _execute_for_ids(cursor, statement, user_ids, params=()):
+    """Run ``statement`` (ending in "WHERE id IN") chunk by chunk; returns rows affected"""
+    affected = 0
+    for chunk in _chunks(user_ids):
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"{statement} ({placeholders})", tuple(params) + tuple(chunk))
+        affected += cursor.rowcount
+    return affected
+
+def bulk_update_status(user_ids, is_active):
+    """Activate or deactivate many users; returns rows changed"""
+    try:
+        with transaction() as cursor:
+            changed = _execute_for_ids(
+                cursor,
+                "UPDATE users SET is_active = %s, session_version = session_version + 1, "
+                "row_version = row_version + 1 "
+                "WHERE is_active <> %s AND id IN",
+                user_ids, (is_active, is_active)
+            )
+            stats.record_status_change(cursor, changed if is_active else -changed)
+            if changed:
+                bump_version(cursor, USERS_CACHE)
+                for chunk in _chunks(user_ids):
+                    user_sessions.revoke(cursor, chunk)
+    except DatabaseError:
+        return None
+    user_cache.invalidate(*user_ids)
+    user_sessions.revocations.invalidate()
+    return changed
+
+def bulk_update_role(user_ids, role):
+    """Change the role of many users; returns rows changed"""
+    try:
+        with transaction() as cursor:
+            changed = _execute_for_ids(
+                cursor,
+                "UPDATE users SET role = %s, session_version = session_version + 1, "
+                "row_version = row_version + 1 "
+                "WHERE role <> %s AND id IN",
+                user_ids, (role, role)
+            )
+            stats.record_role_change(cursor, changed if role == 'admin' else -changed)
+            if changed:
+                bump_version(cursor, USERS_CACHE)
+                bump_version(cursor, HOMEPAGE_CACHE)
+                for chunk in _chunks(user_ids):
+                    user_sessions.revoke(cursor, chunk)
+    except DatabaseError:
+        return None
+    user_cache.invalidate(*user_ids)
+    user_sessions.revocations.invalidate()
+    homepage_cache.invalidate()
+    return changed
+
+def bulk_delete_users(user_ids):
+    """Delete many users; returns rows deleted"""
+    try:
+        with transaction() as cursor:
+            removed = []
+            for chunk in _chunks(user_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"""
+                    SELECT role, is_active, DATE(created_at) AS day FROM users
+                    WHERE id IN ({placeholders}) FOR UPDATE
+                """, tuple(chunk))
+                removed.extend(cursor.fetchall())
+            deleted = _execute_for_ids(cursor, "DELETE FROM users WHERE id IN", user_ids)
+            stats.record_deleted(cursor, removed)
+            if deleted:
+                bump_version(cursor, USERS_CACHE)
+                user_sessions.revoke_deleted(cursor, user_ids)
+            if any(row['role'] == 'admin' for row in removed):
+                bump_version(cursor, HOMEPAGE_CACHE)
+    except DatabaseError:
+        return None
+    user_cache.invalidate(*user_ids)
+    user_sessions.revocations.invalidate()
+    homepage_cache.invalidate()
+    return deleted
+
+def get_user_by_username(username, columns=USER_KEY_COLUMNS):
+    """Get user by username (cached)"""
+    query = _select_users(columns) + " WHERE username = %s"
+    return user_cache.get_by('username', username, columns, lambda: execute_one(
+        query, (username,), prepared=True, row_factory=User.row_factory(columns)))
+
+def get_user_by_email(email, columns=USER_KEY_COLUMNS):
+    """Get user by email (cached)"""
+    query = _select_users(columns) + " WHERE email = %s"
+    return user_cache.get_by('email', email, columns, lambda: execute_one(
+        query, (email,), prepared=True, row_factory=User.row_factory(columns)))
+
+def get_user_by_id(user_id, columns=USER_PROFILE_COLUMNS):
+    """Get user by ID (cached)"""
+    query = _select_users(columns) + " WHERE id = %s"
+    return user_cache.get(user_id, columns, lambda: execute_one(
+        query, (user_id,), prepared=True, row_factory=User.row_factory(columns)))
 
 def verify_login(username, password):
-    """Verify user login credentials"""
-    user = get_user_by_username(username)
-    if user and user['password'] == hash_password(password):
-        if user['is_active'] == 1:
-            return user
+    """Verify user login credentials; may raise HashingBusy under load"""
+    user = get_user_by_username(username, USER_AUTH_COLUMNS)
+    if not passwords.verify_password(user['password'] if user else None, password):
+        return None
+    if passwords.needs_rehash(user['password']):
+        rehash_password(user['id'], user['password'], password)
+    if user['is_active'] == 1:
+        return user
     return None
 
+def rehash_password(user_id, old_hash, password):
+    """Replace a legacy or outdated hash after the password was verified.
+
+    Only replaces ``old_hash``, so a concurrent login or password change
+    wins. Other workers may keep the old hash cached until it expires; it
+    still verifies the same password, and their own rehash is a no-op.
+    """
+    query = "UPDATE users SET password = %s WHERE id = %s AND password = %s"
+    new_hash = hash_password(password)
+    try:
+        with transaction() as cursor:
+            cursor.execute(query, (new_hash, user_id, old_hash))
+            updated = cursor.rowcount
+    except DatabaseError:
+        return False
+    user_cache.invalidate(user_id)
+    return bool(updated)
+
 def get_admin_user():
-    """Get the first admin user for homepage display"""
-    query = "SELECT * FROM users WHERE role = 'admin' LIMIT 1"
-    return execute_one(query)
+    """Get the first admin user for homepage display (None if none or on error)"""
+    query = _select_users(USER_PUBLIC_COLUMNS) + " WHERE role = 'admin' LIMIT 1"
+    return execute_one(query, row_factory=User.row_factory(USER_PUBLIC_COLUMNS))
 
 def get_all_users():
     """Get all users from database"""
-    query = "SELECT * FROM users ORDER BY id DESC"
-    return execute_query(query, fetch=True)
+    query = _select_users(USER_ADMIN_ROW_COLUMNS) + " ORDER BY id DESC"
+    return execute_query(query, fetch=True, row_factory=User.row_factory(USER_ADMIN_ROW_COLUMNS))
+
+def iter_all_users():
+    """Stream all users, newest first, without loading them into memory"""
+    query = _select_users(USER_ADMIN_ROW_COLUMNS) + " ORDER BY id DESC"
+    return iter_query(query, row_factory=User.row_factory(USER_ADMIN_ROW_COLUMNS))
+
+def get_recent_users(limit=5):
+    """Get the newest users"""
+    query = _select_users(USER_ADMIN_ROW_COLUMNS) + " ORDER BY id DESC LIMIT %s"
+    return execute_query(query, (limit,), fetch=True,
+                         row_factory=User.row_factory(USER_ADMIN_ROW_COLUMNS))
+
+# Columns the admin user list can be sorted by. Every combination of the
+# role/status filters with one of them has an index (filters, sort column,
+# id; see setup_database.py), so a page is a short range scan
+USER_SORT_COLUMNS = ('id', 'username', 'email', 'created_at')
+USERS_PER_PAGE = 50
+
+
+class UserPage:
+    """One keyset page of users.
+
+    Iterating it streams the rows; afterwards ``has_next`` and
+    ``next_cursor`` tell the template whether and where the next page
+    starts. The query asks for one extra row to detect a next page.
+    """
+
+    def __init__(self, rows, limit, sort):
+        self._rows = rows
+        self.limit = limit
+        self.sort = sort
+        self.count = 0
+        self.has_next = False
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for row in self._rows:
+            if self.count == self.limit:
+                # the look-ahead row: keep draining instead of breaking so
+                # the streaming cursor finishes cleanly
+                self.has_next = True
+                continue
+            self.count += 1
+            last = row
+            yield row
+        if self.has_next and last is not None:
+            self.next_cursor = (last[self.sort], last['id'])
+
+def get_users_page(role=None, is_active=None, sort='id', direction='desc',
+                   after=None, limit=USERS_PER_PAGE):
+    """Get one page of users with filters and sorting done in SQL.
+
+    ``after`` is the (sort value, id) pair of the last row of the previous
+    page. Seeking past it instead of using OFFSET keeps every page equally
+    cheap no matter how deep into the table it is.
+    """
+    if sort not in USER_SORT_COLUMNS:
+        sort = 'id'
+    op, order = ('>', 'ASC') if direction == 'asc' else ('<', 'DESC')
+
+    where = []
+    params = []
+    if role:
+        where.append("role = %s")
+        params.append(role)
+    if is_active is not None:
+        where.append("is_active = %s")
+        params.append(is_active)
+    if after is not None:
+        value, last_id = after
+        if sort == 'id':
+            where.append(f"id {op} %s")
+            params.append(last_id)
+        else:
+            where.append(f"({sort} {op} %s OR ({sort} = %s AND id {op} %s))")
+            params.extend([value, value, last_id])
+
+    query = _select_users(USER_ADMIN_ROW_COLUMNS)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY {sort} {order}"
+    if sort != 'id':
+        query += f", id {order}"
+    query += " LIMIT %s"
+    params.append(limit + 1)
+    rows = iter_query(query, tuple(params), row_factory=User.row_factory(USER_ADMIN_ROW_COLUMNS))
+    return UserPage(rows, limit, sort)
 
 def update_user(user_id, firstname, middlename, lastname, birthday, contact, email):
     """Update user profile information"""
     query = """
         UPDATE users SET firstname=%s, middlename=%s, lastname=%s, 
-                        birthday=%s, contact=%s, email=%s
+                        birthday=%s, contact=%s, email=%s, row_version = row_version + 1
         WHERE id = %s
     """
     params = (firstname, middlename, lastname, birthday, contact, email, user_id)
-    return execute_query(query, params)
+    try:
+        with transaction() as cursor:
+            cursor.execute(query, params)
+            result = cursor.rowcount
+            bump_version(cursor, USERS_CACHE)
+            cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+            row = cursor.fetchone()
+            if row and row['role'] == 'admin':
+                bump_version(cursor, HOMEPAGE_CACHE)
+    except DatabaseError:
+        return None
+    user_cache.invalidate(user_id)
+    homepage_cache.invalidate()
+    return result
 
 def update_user_status(user_id, is_active):
     """Activate or deactivate a user"""
-    query = "UPDATE users SET is_active = %s WHERE id = %s"
-    return execute_query(query, (is_active, user_id))
+    return bulk_update_status([user_id], is_active)
 
 def delete_user(user_id):
     """Delete a user from database"""
-    query = "DELETE FROM users WHERE id = %s"
-    return execute_query(query, (user_id,))
+    return bulk_delete_users([user_id])
 
 def admin_update_user(user_id, username, email, firstname, middlename, lastname, 
                       birthday, contact, role):
     """Admin update user with all fields"""
     query = """
         UPDATE users SET username=%s, email=%s, firstname=%s, middlename=%s, 
-                        lastname=%s, birthday=%s, contact=%s, role=%s
+                        lastname=%s, birthday=%s, contact=%s, role=%s,
+                        session_version = session_version + 1, row_version = row_version + 1
         WHERE id = %s
     """
     params = (username, email, firstname, middlename, lastname, birthday, 
               contact, role, user_id)
-    return execute_query(query, params)
+    try:
+        with transaction() as cursor:
+            # Count a role change before the full update overwrites it
+            cursor.execute("UPDATE users SET role = %s WHERE id = %s AND role <> %s",
+                           (role, user_id, role))
+            if cursor.rowcount:
+                stats.record_role_change(cursor, 1 if role == 'admin' else -1)
+            cursor.execute(query, params)
+            result = cursor.rowcount
+            bump_version(cursor, USERS_CACHE)
+            # The homepage shows an admin's profile; edits here are rare
+            bump_version(cursor, HOMEPAGE_CACHE)
+            user_sessions.revoke(cursor, [user_id])
+    except DatabaseError:
+        return None
+    user_cache.invalidate(user_id)
+    user_sessions.revocations.invalidate()
+    homepage_cache.invalidate()
+    return result
 
 # ============ OTP OPERATIONS ============
 
 def save_otp(email, otp_code):
-    """Save OTP to database"""
-    # Delete old OTPs for this email first
-    delete_query = "DELETE FROM otp_codes WHERE email = %s"
-    execute_query(delete_query, (email,))
-    
-    # Insert new OTP
-    query = "INSERT INTO otp_codes (email, otp_code, created_at) VALUES (%s, %s, NOW())"
-    return execute_query(query, (email, otp_code))
+    """Save OTP to database, replacing any older code for this email"""
+    try:
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM otp_codes WHERE email = %s", (email,))
+            cursor.execute(
+                "INSERT INTO otp_codes (email, otp_code, created_at) VALUES (%s, %s, NOW())",
+                (email, otp_code)
+            )
+            return cursor.lastrowid
+    except DatabaseError:
+        return None
 
 def verify_otp(email, otp_code):
-    """Verify OTP code"""
+    """Verify OTP code and consume it"""
     query = """
-        SELECT * FROM otp_codes 
+        DELETE FROM otp_codes 
         WHERE email = %s AND otp_code = %s 
-        AND created_at > DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+        AND created_at > DATE_SUB(NOW(), INTERVAL %s MINUTE)
     """
-    result = execute_one(query, (email, otp_code))
-    if result:
-        # Delete used OTP
-        delete_query = "DELETE FROM otp_codes WHERE email = %s"
-        execute_query(delete_query, (email,))
-        return True
-    return False
-
-def check_email_spam(email):
-    """Check if too many OTPs sent recently (spam prevention)"""
-    query = """
-        SELECT COUNT(*) as count FROM email_log 
-        WHERE email = %s AND sent_at > DATE_SUB(NOW(), INTERVAL 1 HOUR)
-    """
-    result = execute_one(query, (email,))
-    if result and result['count'] >= 3:
-        return True  # Too many emails sent
-    return False
-
-def log_email_sent(email):
-    """Log email sent for spam prevention"""
-    query = "INSERT INTO email_log (email, sent_at) VALUES (%s, NOW())"
-    return execute_query(query, (email,))
+    try:
+        with transaction() as cursor:
+            cursor.execute(query, (email, otp_code, OTP_EXPIRY_MINUTES))
+            if cursor.rowcount == 0:
+                return False
+            # Delete any other OTPs left for this email
+            cursor.execute("DELETE FROM otp_codes WHERE email = %s", (email,))
+            return True
+    except DatabaseError:
+        return False
 
 # ============ PENDING REGISTRATION ============
 
 def save_pending_registration(username, password, email, firstname, middlename, 
                               lastname, birthday, contact):
-    """Save pending registration data"""
-    # Delete old pending registration for this email
-    delete_query = "DELETE FROM pending_registrations WHERE email = %s"
-    execute_query(delete_query, (email,))
-    
+    """Save pending registration data, replacing any older one for this email"""
     hashed_pw = hash_password(password)
     query = """
         INSERT INTO pending_registrations 
@@ -146,7 +496,13 @@ def save_pending_registration(username, password, email, firstname, middlename,
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
     """
     params = (username, hashed_pw, email, firstname, middlename, lastname, birthday, contact)
-    return execute_query(query, params)
+    try:
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM pending_registrations WHERE email = %s", (email,))
+            cursor.execute(query, params)
+            return cursor.lastrowid
+    except DatabaseError:
+        return None
 
 def get_pending_registration(email):
     """Get pending registration by email"""
@@ -155,42 +511,87 @@ def get_pending_registration(email):
 
 def complete_registration(email):
     """Complete registration by moving from pending to users"""
-    pending = get_pending_registration(email)
-    if pending:
-        query = """
-            INSERT INTO users (username, password, email, firstname, middlename, 
-                              lastname, birthday, contact, role, is_active, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'user', 1, NOW())
-        """
-        params = (pending['username'], pending['password'], pending['email'], 
-                  pending['firstname'], pending['middlename'], pending['lastname'],
-                  pending['birthday'], pending['contact'])
-        result = execute_query(query, params)
-        
-        # Delete pending registration
-        delete_query = "DELETE FROM pending_registrations WHERE email = %s"
-        execute_query(delete_query, (email,))
-        
-        return result
-    return None
+    query = """
+        INSERT INTO users (username, password, email, firstname, middlename, 
+                          lastname, birthday, contact, role, is_active, created_at)
+        SELECT username, password, email, firstname, middlename, 
+               lastname, birthday, contact, 'user', 1, NOW()
+        FROM pending_registrations WHERE email = %s
+    """
+    try:
+        with transaction() as cursor:
+            cursor.execute(query, (email,))
+            if cursor.rowcount == 0:
+                return None
+            result = cursor.lastrowid
+            stats.record_created(cursor, 1)
+            cursor.execute("DELETE FROM pending_registrations WHERE email = %s", (email,))
+    except DatabaseError:
+        return None
+    user_cache.invalidate(result)
+    return result
 
 # ============ SITE CONTENT OPERATIONS ============
 
+# Site content and the admin profile shown on "/"; bumped by every write
+# that can change either of them
+HOMEPAGE_CACHE = 'homepage'
+homepage_cache = TTLCache(HOMEPAGE_CACHE, ttl=HOMEPAGE_CACHE_TTL)
+
 def get_site_content():
-    """Get all site content as dictionary"""
+    """Get all site content as dictionary, or None if the query failed"""
     query = "SELECT content_key, content_value FROM site_content"
     results = execute_query(query, fetch=True)
-    content = {}
-    if results:
-        for row in results:
-            content[row['content_key']] = row['content_value']
-    return content
+    if results is None:
+        return None
+    return {row['content_key']: row['content_value'] for row in results}
+
+def get_cached_site_content():
+    """get_site_content() served from the homepage cache"""
+    return homepage_cache.get('site_content', get_site_content) or {}
+
+def get_cached_admin_user():
+    """get_admin_user() served from the homepage cache.
+
+    None is never cached, so a failed lookup (or a site without an admin)
+    is retried on the next request.
+    """
+    return homepage_cache.get('admin_user', get_admin_user)
+
+def warm_homepage_cache():
+    """Load the homepage data before the first request needs it"""
+    get_cached_site_content()
+    get_cached_admin_user()
+
+def invalidate_homepage():
+    """Make every worker reload and re-render the homepage"""
+    try:
+        with transaction() as cursor:
+            bump_version(cursor, HOMEPAGE_CACHE)
+    except DatabaseError:
+        return None
+    homepage_cache.invalidate()
+    return True
 
 def update_site_content(content_key, content_value):
     """Update site content by key"""
-    query = """
-        INSERT INTO site_content (content_key, content_value) 
-        VALUES (%s, %s)
-        ON DUPLICATE KEY UPDATE content_value = %s
+    return update_site_contents({content_key: content_value})
+
+def update_site_contents(items):
+    """Upsert several content keys in one multi-row statement"""
+    rows = list(items.items())
+    placeholders = ', '.join(['(%s, %s)'] * len(rows))
+    query = f"""
+        INSERT INTO site_content (content_key, content_value)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE content_value = VALUES(content_value)
     """
-    return execute_query(query, (content_key, content_value, content_value))
+    try:
+        with transaction() as cursor:
+            cursor.execute(query, tuple(value for row in rows for value in row))
+            bump_version(cursor, HOMEPAGE_CACHE)
+            result = cursor.rowcount
+    except DatabaseError:
+        return None
+    homepage_cache.invalidate()
+    return result
@@ -0,0 +1,168 @@
+# page_cache.py - Full-page cache for anonymous GET requests
+#
+# Rendered pages are kept per worker in a bounded LRU, keyed by path and
+# stored with the content version they were rendered from. Requests with a
+# query string are never cached, so made-up URLs cannot fill the store.
+# Responses carry a strong ETag so browsers revalidate with If-None-Match
+# and usually get a 304. An expired or outdated page is served while a
+# background thread renders a new one, so a slow or unreachable database
+# never holds up a request for a page that is already cached; after a
+# failed render the last good page keeps being served.
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+from flask import Response, copy_current_request_context, request, session
+from config import PAGE_CACHE_ENABLED, PAGE_CACHE_TTL, PAGE_CACHE_RETRY_SECONDS, PAGE_CACHE_SIZE
+from cache import LRUBackend
+from database import request_had_errors
+from compression import encoded_etags
+
+logger = logging.getLogger(__name__)
+
+# Session keys that don't make a visitor's pages personal
+ANONYMOUS_SESSION_KEYS = {'_db_write_at'}
+
+
+class CachedPage:
+    __slots__ = ('body', 'mimetype', 'etag', 'version', 'render_time', 'expires_at', 'retry_at')
+
+    def __init__(self, body, mimetype, version, render_time, ttl):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.version = version
+        self.render_time = render_time
+        self.expires_at = time.monotonic() + ttl
+        self.retry_at = 0.0
+
+
+class PageCache:
+    """Decorator factory and store for cached anonymous pages"""
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, retry=PAGE_CACHE_RETRY_SECONDS, enabled=PAGE_CACHE_ENABLED,
+                 maxsize=PAGE_CACHE_SIZE):
+        self.ttl = ttl
+        self.retry = retry
+        self.enabled = enabled
+        # path -> CachedPage; pages outlive their ttl as the stale fallback,
+        # so only the size bound evicts them
+        self._pages = LRUBackend(maxsize=maxsize, ttl=float('inf'))
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.not_modified = self.errors_masked = 0
+        self.render_time_saved = 0.0
+
+    def _cacheable(self):
+        return (self.enabled and request.method == 'GET' and not request.args
+                and set(session.keys()) <= ANONYMOUS_SESSION_KEYS)
+
+    def _render(self, view, args, kwargs, version):
+        """Run the view; returns (response, CachedPage or None if not cacheable)"""
+        start = time.perf_counter()
+        response = view(*args, **kwargs)
+        if not isinstance(response, Response):
+            response = Response(response)
+        render_time = time.perf_counter() - start
+        if (response.status_code != 200 or response.is_streamed or request_had_errors()
+                or 'Set-Cookie' in response.headers):
+            return response, None
+        page = CachedPage(response.get_data(), response.mimetype, version, render_time, self.ttl)
+        return response, page
+
+    def _refresh_in_background(self, path, view, args, kwargs, stamp):
+        with self._lock:
+            if path in self._refreshing:
+                return
+            self._refreshing.add(path)
+
+        @copy_current_request_context
+        def refresh():
+            try:
+                version = stamp.current() if stamp is not None else None
+                _, page = self._render(view, args, kwargs, version)
+                if page is not None:
+                    self._pages.set(path, page)
+                else:
+                    stale = self._pages.get(path)
+                    if stale is not None:
+                        stale.retry_at = time.monotonic() + self.retry
+            except Exception:
+                logger.exception("Background render of %s failed", path)
+            finally:
+                self._refreshing.discard(path)
+
+        threading.Thread(target=refresh, name='page-refresh', daemon=True).start()
+
+    def _respond(self, page):
+        # a compressed copy of the page was sent with a suffixed ETag; a 304
+        # repeats the tag the client holds
+        matched = next((etag for etag in encoded_etags(page.etag)
+                        if request.if_none_match.contains(etag)), None)
+        if matched is not None:
+            self.not_modified += 1
+            response = Response(status=304)
+            response.set_etag(matched)
+        else:
+            response = Response(page.body, mimetype=page.mimetype)
+            response.set_etag(page.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Cookie'
+        return response
+
+    def cached(self, version=None):
+        """Cache the view's anonymous GET responses.
+
+        ``version`` is the VersionStamp of the data the page shows. Once a
+        page is cached, requests never wait for the database: an expired
+        page, or one rendered from an older version, is served while a
+        background thread renders its replacement, and after a failed
+        render the old page is kept for ``retry`` seconds before trying
+        again. Only the first request for a path renders inline.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable():
+                    return view(*args, **kwargs)
+
+                path = request.path
+                page = self._pages.get(path)
+                if page is not None:
+                    current = version.current(wait=False) if version is not None else None
+                    now = time.monotonic()
+                    if page.version == current and page.expires_at > now:
+                        self.hits += 1
+                    elif page.retry_at > now:
+                        # the database failed us recently; don't hammer it
+                        self.errors_masked += 1
+                    else:
+                        self.stale += 1
+                        self._refresh_in_background(path, view, args, kwargs, version)
+                    self.render_time_saved += page.render_time
+                    return self._respond(page)
+
+                self.misses += 1
+                current = version.current() if version is not None else None
+                response, fresh = self._render(view, args, kwargs, current)
+                if fresh is not None:
+                    self._pages.set(path, fresh)
+                    return self._respond(fresh)
+                return response
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self._pages.clear()
+
+    def stats(self):
+        served = self.hits + self.stale + self.misses + self.errors_masked
+        return {'pages': self._pages.stats()['entries'], 'hits': self.hits, 'stale_served': self.stale,
+                'misses': self.misses, 'not_modified': self.not_modified,
+                'errors_masked': self.errors_masked,
+                'hit_rate': f'{(self.hits + self.stale) / served:.0%}' if served else '-',
+                'render_time_saved': f'{self.render_time_saved * 1000:.0f}ms'}
+
+
+page_cache = PageCache()
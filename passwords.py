@@ -0,0 +1,174 @@
+# passwords.py - Salted, tunable password hashes computed in a bounded pool
+#
+# Hashes use Werkzeug's scrypt or PBKDF2 format ("method$salt$hash"), so the
+# cost parameters travel with every stored hash and can be raised at any
+# time: needs_rehash() reports hashes made with other parameters, and
+# models.verify_login() upgrades them after a successful login. Hashes from
+# before this module (unsalted SHA-256 hex digests) still verify and are
+# upgraded the same way.
+#
+# Hashing runs in a pool of PASSWORD_HASH_WORKERS threads (hashlib releases
+# the GIL while it works), which caps the CPU and, for scrypt, the memory
+# spent on logins at once. Callers wait at most PASSWORD_HASH_WAIT_SECONDS
+# for a free slot and get HashingBusy otherwise.
+#
+# `python passwords.py calibrate` picks parameters meeting a target latency
+# on this machine.
+import hashlib
+import hmac
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+from config import (PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_WAIT_SECONDS,
+                    PASSWORD_HASH_TARGET_MS)
+
+# Lowest parameters calibrate() will suggest, however fast the target
+MIN_SCRYPT_N = 2 ** 14
+MIN_PBKDF2_ITERATIONS = 600000
+
+_LEGACY_HASH = re.compile(r'[0-9a-f]{64}')
+_STORED_HASH = re.compile(r'(scrypt:\d+:\d+:\d+|pbkdf2:\w+:\d+)\$[^$]+\$[0-9a-f]+')
+
+
+class HashingBusy(Exception):
+    """No hashing slot became free within PASSWORD_HASH_WAIT_SECONDS"""
+
+
+class HashPool:
+    """Runs hash computations on at most ``workers`` threads"""
+
+    def __init__(self, workers, wait_seconds):
+        self.workers = workers
+        self.wait_seconds = wait_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='passwords')
+        # running plus queued jobs; bounded so a login flood cannot queue forever
+        self._slots = threading.BoundedSemaphore(workers * 4)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def map(self, fn, items):
+        futures = [self.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
+
+
+pool = HashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_WAIT_SECONDS)
+
+
+def _hash(password, method=PASSWORD_HASH_METHOD):
+    return generate_password_hash(password, method=method)
+
+def _check(stored, password):
+    if is_legacy(stored):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    return check_password_hash(stored, password)
+
+def is_legacy(stored):
+    """True for the unsalted SHA-256 digests stored before this module"""
+    return bool(_LEGACY_HASH.fullmatch(stored))
+
+def is_stored_hash(value):
+    """True if ``value`` is a hash verify_password() accepts (imported hashes)"""
+    return is_legacy(value) or bool(_STORED_HASH.fullmatch(value))
+
+def hash_password(password):
+    """Salted hash of ``password`` with the configured method"""
+    return pool.run(_hash, password)
+
+def hash_passwords(passwords):
+    """Hash many passwords (bulk imports), using every worker of the pool"""
+    return pool.map(_hash, passwords)
+
+def verify_password(stored, password):
+    """Check ``password`` against a stored hash; pass None for an unknown user.
+
+    An unknown user still costs one hash so response times do not reveal
+    which usernames exist.
+    """
+    if stored is None:
+        pool.run(_check, _dummy_hash(), password)
+        return False
+    return pool.run(_check, stored, password)
+
+def needs_rehash(stored):
+    """True if ``stored`` was not made with the configured method and parameters"""
+    return is_legacy(stored) or stored.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+_dummy = None
+
+def _dummy_hash():
+    global _dummy
+    if _dummy is None:
+        _dummy = _hash('dummy password')
+    return _dummy
+
+
+# ============ CALIBRATION ============
+
+def time_method(method, rounds=3):
+    """Median seconds to verify one hash made with ``method``"""
+    stored = _hash('calibration password', method)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        check_password_hash(stored, 'calibration password')
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+def calibrate(algorithm='scrypt', target_ms=PASSWORD_HASH_TARGET_MS):
+    """Strongest parameters of ``algorithm`` that verify within ``target_ms`` here.
+
+    Returns (method, milliseconds). Never goes below the MIN_* floors, so on
+    a slow machine the result may exceed the target.
+    """
+    target = target_ms / 1000
+    if algorithm == 'scrypt':
+        n = MIN_SCRYPT_N
+        elapsed = time_method(f'scrypt:{n}:8:1')
+        # each doubling of N doubles time and memory (128 * N * r bytes)
+        while elapsed * 2 <= target:
+            n *= 2
+            elapsed = time_method(f'scrypt:{n}:8:1')
+        method = f'scrypt:{n}:8:1'
+    elif algorithm == 'pbkdf2':
+        probe = 100000
+        per_iteration = time_method(f'pbkdf2:sha256:{probe}') / probe
+        iterations = max(MIN_PBKDF2_ITERATIONS, int(target / per_iteration) // 10000 * 10000)
+        method = f'pbkdf2:sha256:{iterations}'
+        elapsed = time_method(method)
+    else:
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+    return method, elapsed * 1000
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Password hashing tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    calibrate_cmd = subcommands.add_parser('calibrate', help='choose hash parameters for a target latency')
+    calibrate_cmd.add_argument('--algorithm', choices=('scrypt', 'pbkdf2'), default='scrypt')
+    calibrate_cmd.add_argument('--target-ms', type=float, default=PASSWORD_HASH_TARGET_MS)
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        method, elapsed = calibrate(args.algorithm, args.target_ms)
+        print(f"{method}: {elapsed:.1f} ms per verification (target {args.target_ms:g} ms)")
+        if method != PASSWORD_HASH_METHOD:
+            print(f"Set PASSWORD_HASH_METHOD={method} (currently {PASSWORD_HASH_METHOD}); "
+                  "existing hashes are upgraded as users log in.")
+        else:
+            print("PASSWORD_HASH_METHOD is already set to this value.")
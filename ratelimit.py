@@ -0,0 +1,336 @@
+# ratelimit.py - Request throttling by email, IP address or username
+#
+#     LOGIN_USER = RateLimit('login-user', 10, 15 * 60)
+#
+#     @app.route('/login', methods=['GET', 'POST'])
+#     @limit(LOGIN_USER, form_field('username'))
+#     def login(): ...
+#
+# A RateLimit allows ``limit`` hits per ``period`` seconds for each key,
+# counted with one of two algorithms:
+#
+#   sliding-window  a fixed-window count weighted with the previous window,
+#                   a smooth "N per period" quota (OTP emails, per account)
+#   token-bucket    ``limit`` tokens refilled steadily over ``period``,
+#                   allowing short bursts (per IP address)
+#
+# Either algorithm keeps three numbers per key, stored by the backend named
+# in RATELIMIT_BACKEND:
+#
+#   memory    a dict in this worker; limits are per process
+#   shared    a hash table in a memory-mapped file, shared by every worker
+#             on this host (needs fcntl, i.e. not Windows)
+#   database  the rate_limits table, for several hosts; three statements
+#             per hit, expired rows are purged by maintenance.py
+#
+# If the backend fails the request is allowed; throttling is never a
+# reason to turn users away.
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import request, session
+from werkzeug.exceptions import TooManyRequests
+from config import (RATELIMIT_ENABLED, RATELIMIT_BACKEND, RATELIMIT_MEMORY_SIZE,
+                    RATELIMIT_SHM_PATH, RATELIMIT_SHM_SLOTS)
+from database import transaction, DatabaseError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+Decision = namedtuple('Decision', 'allowed remaining retry_after')
+
+
+class RateLimited(TooManyRequests):
+    """Raised by @limit; ``endpoint`` is where the user is sent back to"""
+
+    def __init__(self, retry_after, endpoint):
+        super().__init__(retry_after=int(retry_after) + 1)
+        self.retry_after = retry_after
+        self.endpoint = endpoint
+
+
+# ============ ALGORITHMS ============
+#
+# Each takes the stored state (None for a new or expired key) and returns
+# (new state, Decision); the state is a tuple of three floats.
+
+def sliding_window(state, now, limit, period, cost=1):
+    window = now - now % period
+    start, previous, current = state or (window, 0.0, 0.0)
+    if start != window:
+        previous = current if window - start == period else 0.0
+        current, start = 0.0, window
+    elapsed = now - window
+    estimate = previous * (1 - elapsed / period) + current
+    if estimate + cost <= limit:
+        current += cost
+        return (start, previous, current), Decision(True, int(limit - estimate - cost), 0.0)
+    # time until the weighted count leaves room for ``cost`` more
+    if current + cost > limit:
+        wait = period - elapsed + period * max(0.0, 1 - (limit - cost) / current)
+    else:
+        wait = period * (1 - (limit - cost - current) / previous) - elapsed
+    return (start, previous, current), Decision(False, 0, max(wait, 0.0))
+
+def token_bucket(state, now, limit, period, cost=1):
+    rate = limit / period
+    tokens, updated, _ = state or (float(limit), now, 0.0)
+    tokens = min(float(limit), tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return (tokens - cost, now, 0.0), Decision(True, int(tokens - cost), 0.0)
+    return (tokens, now, 0.0), Decision(False, 0, (cost - tokens) / rate)
+
+ALGORITHMS = {
+    'sliding-window': sliding_window,
+    'token-bucket': token_bucket
+}
+
+
+# ============ BACKENDS ============
+#
+# update(key, step, ttl) runs step(state) -> (new state, result) atomically
+# for ``key``, stores the new state for ``ttl`` seconds and returns result.
+
+class MemoryBackend:
+    """Per-process states in a bounded LRU dict"""
+
+    def __init__(self, maxsize=RATELIMIT_MEMORY_SIZE, **options):
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (state, expires_at)
+        self._lock = threading.Lock()
+
+    def update(self, key, step, ttl):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            state = item[0] if item is not None and item[1] > now else None
+            state, result = step(state)
+            self._data[key] = (state, now + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return result
+
+
+class SharedMemoryBackend:
+    """States in an open-addressing hash table in a memory-mapped file.
+
+    Every worker maps the same file; updates hold an exclusive flock() on
+    it (plus a thread lock, as flock does not exclude threads sharing the
+    descriptor). Slots are (key hash, three state floats, expires_at). A
+    key lives in the first matching slot among PROBES from its hash;
+    when none is free the one closest to expiry is taken over.
+
+    The file is opened again in each process: workers forked from a
+    preloaded app would otherwise share one open file description, and
+    flock() does not exclude processes sharing one.
+    """
+
+    MAGIC = b'RLIMIT01'
+    HEADER = struct.Struct('<8sQ')
+    SLOT = struct.Struct('<Q4d')
+    PROBES = 16
+
+    def __init__(self, path=RATELIMIT_SHM_PATH, slots=RATELIMIT_SHM_SLOTS, **options):
+        if fcntl is None:
+            raise RuntimeError("The shared rate-limit backend needs fcntl (not available here)")
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._open_lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        size = self.HEADER.size + self.slots * self.SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, self.HEADER.size, 0)
+            if header != self.HEADER.pack(self.MAGIC, self.slots) or os.fstat(fd).st_size != size:
+                # new file, or one laid out for another slot count: start empty
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, self.HEADER.pack(self.MAGIC, self.slots), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') | 1    # 0 marks an empty slot
+
+    def _offset(self, index):
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _find(self, key_hash, now):
+        """Offset of the key's slot, or of the slot to take for it"""
+        free = oldest = None
+        oldest_expiry = float('inf')
+        for probe in range(self.PROBES):
+            offset = self._offset((key_hash + probe) % self.slots)
+            slot_hash, _, _, _, expires_at = self.SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset
+            if free is None and (slot_hash == 0 or expires_at <= now):
+                free = offset
+            if expires_at < oldest_expiry:
+                oldest, oldest_expiry = offset, expires_at
+        return free if free is not None else oldest
+
+    def update(self, key, step, ttl):
+        key_hash = self._hash(key)
+        if self._pid != os.getpid():
+            # forked since the file was opened; the parent's copies stay unused
+            with self._open_lock:
+                if self._pid != os.getpid():
+                    self._open()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                offset = self._find(key_hash, now)
+                slot_hash, a, b, c, expires_at = self.SLOT.unpack_from(self._map, offset)
+                state = (a, b, c) if slot_hash == key_hash and expires_at > now else None
+                state, result = step(state)
+                self.SLOT.pack_into(self._map, offset, key_hash, *state, now + ttl)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return result
+
+
+class DatabaseBackend:
+    """States in the rate_limits table, one locked row per key"""
+
+    def __init__(self, **options):
+        pass
+
+    def update(self, key, step, ttl):
+        with transaction() as cursor:
+            # create the row if needed; on an existing one this takes the
+            # same exclusive lock as FOR UPDATE, so the two cannot deadlock
+            cursor.execute("""
+                INSERT INTO rate_limits (limit_key, state, expires_at)
+                VALUES (%s, '', NOW())
+                ON DUPLICATE KEY UPDATE limit_key = limit_key
+            """, (key,))
+            cursor.execute("""
+                SELECT state, expires_at > NOW() AS live FROM rate_limits
+                WHERE limit_key = %s FOR UPDATE
+            """, (key,))
+            row = cursor.fetchone()
+            state = None
+            if row and row['live'] and row['state']:
+                state = tuple(float(value) for value in row['state'].split(','))
+            state, result = step(state)
+            # expiry on the database clock, like the NOW() it is compared to
+            cursor.execute("""
+                UPDATE rate_limits SET state = %s, expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE limit_key = %s
+            """, (','.join(repr(value) for value in state), math.ceil(ttl), key))
+        return result
+
+
+RATELIMIT_BACKENDS = {
+    'memory': MemoryBackend,
+    'shared': SharedMemoryBackend,
+    'database': DatabaseBackend
+}
+
+def create_backend(kind, **options):
+    try:
+        backend_class = RATELIMIT_BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown rate-limit backend: {kind!r}") from None
+    try:
+        return backend_class(**options)
+    except (RuntimeError, OSError) as err:
+        logger.warning("Rate-limit backend %r unavailable (%s); using the database", kind, err)
+        return DatabaseBackend()
+
+backend = create_backend(RATELIMIT_BACKEND)
+
+
+# ============ LIMITS ============
+
+class RateLimit:
+    """``limit`` hits per ``period`` seconds for each key"""
+
+    def __init__(self, name, limit, period, algorithm='sliding-window'):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.algorithm = ALGORITHMS[algorithm]
+
+    def hit(self, key, cost=1):
+        """Count one hit for ``key``; returns a Decision"""
+        if not RATELIMIT_ENABLED:
+            return Decision(True, self.limit, 0.0)
+        def step(state):
+            return self.algorithm(state, time.time(), self.limit, self.period, cost)
+        try:
+            # the previous window matters to sliding-window, so keep two
+            return backend.update(f'{self.name}:{key}', step, 2 * self.period)
+        except (DatabaseError, OSError, ValueError):
+            logger.exception("Rate limit %s failed; allowing the request", self.name)
+            return Decision(True, self.limit, 0.0)
+
+
+# ============ REQUEST KEYS AND DECORATOR ============
+
+def client_ip():
+    return request.remote_addr
+
+def form_field(name):
+    """Key on a form field, case-insensitively (usernames, emails)"""
+    def key():
+        value = (request.form.get(name) or '').strip().lower()
+        return value or None
+    return key
+
+def session_value(name):
+    """Key on a session value, case-insensitively (the pending email)"""
+    def key():
+        value = str(session.get(name) or '').strip().lower()
+        return value or None
+    return key
+
+def limit(rule, key=client_ip, methods=('POST',), redirect_endpoint=None):
+    """Raise RateLimited for requests over ``rule``.
+
+    ``key()`` returns what the request is counted against; None skips the
+    check. Only ``methods`` are counted. The error handler sends the user
+    back to ``redirect_endpoint`` (default: the same view).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in methods:
+                value = key()
+                if value is not None:
+                    decision = rule.hit(value)
+                    if not decision.allowed:
+                        raise RateLimited(decision.retry_after,
+                                          redirect_endpoint or request.endpoint)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def describe_wait(seconds):
+    """'in 40 seconds' / 'in 12 minutes' for flash messages"""
+    if seconds < 60:
+        return f"in {max(int(seconds) + 1, 1)} seconds"
+    return f"in {int(seconds // 60) + 1} minutes"
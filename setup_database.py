@@ -1,43 +1,20 @@
-
 import mysql.connector
 from dotenv import load_dotenv
 load_dotenv()
-from config import DB_CONFIG
-import hashlib
+from config import DB_BACKEND, DB_CONFIG
+from database import get_backend
+import stats
+from passwords import hash_password
 
 
-def setup_database():
-    
-    try:
-        
-        conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
-        )
-        cursor = conn.cursor()
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
-        print("Database created successfully!")
-        cursor.close()
-        conn.close()
-    except mysql.connector.Error as err:
-        print(f"Error creating database: {err}")
-        return
+# ============ MIGRATIONS ============
+#
+# Each migration runs once per database and is recorded in schema_migrations.
+# Append new ones with the next version number; never edit an applied one.
+# Statements are MySQL SQL, translated by the backend when running on SQLite.
 
-    try:
-        conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
-        cursor = conn.cursor()
-    except mysql.connector.Error as err:
-        print(f"Error connecting to database: {err}")
-        return
-    
-    # Create tables
-    tables = [
+MIGRATIONS = [
+    (1, 'Create base tables', [
         """
         CREATE TABLE IF NOT EXISTS users (
             id INT AUTO_INCREMENT PRIMARY KEY,
@@ -91,11 +68,209 @@ def setup_database():
             updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
         )
         """
-    ]
+    ]),
+    (2, 'Indexes for the admin user list (filters and keyset sort columns)', [
+        "CREATE INDEX idx_users_role_id ON users (role, id)",
+        "CREATE INDEX idx_users_active_id ON users (is_active, id)",
+        "CREATE INDEX idx_users_created_id ON users (created_at, id)"
+    ]),
+    (3, 'Lookup indexes for OTP codes, email log and pending registrations', [
+        "CREATE INDEX idx_otp_codes_email_created ON otp_codes (email, created_at)",
+        "CREATE INDEX idx_otp_codes_created ON otp_codes (created_at)",
+        "CREATE INDEX idx_email_log_email_sent ON email_log (email, sent_at)",
+        "CREATE INDEX idx_email_log_sent ON email_log (sent_at)",
+        "CREATE INDEX idx_pending_email ON pending_registrations (email)",
+        "CREATE INDEX idx_pending_created ON pending_registrations (created_at)"
+    ]),
+    (4, 'User statistics counters and daily signup rollup', [
+        """
+        CREATE TABLE IF NOT EXISTS stat_counters (
+            name VARCHAR(50) PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_signups (
+            day DATE PRIMARY KEY,
+            signups INT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT IGNORE INTO stat_counters (name, value)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL SELECT 'active_users', COUNT(*) FROM users WHERE is_active = 1
+        UNION ALL SELECT 'admins', COUNT(*) FROM users WHERE role = 'admin'
+        """,
+        """
+        INSERT IGNORE INTO daily_signups (day, signups)
+        SELECT DATE(created_at), COUNT(*) FROM users
+        WHERE created_at IS NOT NULL GROUP BY DATE(created_at)
+        """
+    ]),
+    (5, 'Cache version stamps', [
+        """
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name VARCHAR(50) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT IGNORE INTO cache_versions (name, version) VALUES ('homepage', 1)"
+    ]),
+    (6, 'Version stamp for the user cache', [
+        "INSERT IGNORE INTO cache_versions (name, version) VALUES ('users', 1)"
+    ]),
+    (7, 'Session versions and revocations for session user snapshots', [
+        "ALTER TABLE users ADD COLUMN session_version INT NOT NULL DEFAULT 1",
+        """
+        CREATE TABLE IF NOT EXISTS session_revocations (
+            user_id INT PRIMARY KEY,
+            session_version INT NOT NULL
+        )
+        """,
+        "INSERT IGNORE INTO cache_versions (name, version) VALUES ('sessions', 1)"
+    ]),
+    (8, 'Row version for cached user table rows', [
+        "ALTER TABLE users ADD COLUMN row_version INT NOT NULL DEFAULT 1"
+    ]),
+    (9, 'Rate-limit state for the database backend', [
+        """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            limit_key VARCHAR(255) UNIQUE NOT NULL,
+            state VARCHAR(100) NOT NULL,
+            expires_at DATETIME NOT NULL
+        )
+        """,
+        "CREATE INDEX idx_rate_limits_expires ON rate_limits (expires_at)"
+    ]),
+    (10, 'Sequence and timestamp on session revocations', [
+        """
+        CREATE TABLE IF NOT EXISTS session_revocations_new (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT UNIQUE NOT NULL,
+            session_version INT NOT NULL,
+            seq BIGINT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO session_revocations_new (user_id, session_version, updated_at)
+        SELECT user_id, session_version, NOW() FROM session_revocations
+        """,
+        "DROP TABLE session_revocations",
+        "ALTER TABLE session_revocations_new RENAME TO session_revocations",
+        "CREATE INDEX idx_session_revocations_seq ON session_revocations (seq)",
+        "CREATE INDEX idx_session_revocations_updated ON session_revocations (updated_at)"
+    ]),
+    (11, 'Indexes for every filter and sort combination of the admin user list', [
+        "CREATE INDEX idx_users_role_username ON users (role, username, id)",
+        "CREATE INDEX idx_users_role_email ON users (role, email, id)",
+        "CREATE INDEX idx_users_role_created ON users (role, created_at, id)",
+        "CREATE INDEX idx_users_active_username ON users (is_active, username, id)",
+        "CREATE INDEX idx_users_active_email ON users (is_active, email, id)",
+        "CREATE INDEX idx_users_active_created ON users (is_active, created_at, id)",
+        "CREATE INDEX idx_users_role_active_id ON users (role, is_active, id)",
+        "CREATE INDEX idx_users_role_active_username ON users (role, is_active, username, id)",
+        "CREATE INDEX idx_users_role_active_email ON users (role, is_active, email, id)",
+        "CREATE INDEX idx_users_role_active_created ON users (role, is_active, created_at, id)"
+    ]),
+    (12, 'Drop email_log (replaced by rate_limits)', [
+        "DROP TABLE IF EXISTS email_log"
+    ])
+]
+
+
+def applied_migrations(cursor):
+    """Versions already recorded in schema_migrations"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def migrate(backend, cursor):
+    """Apply every pending migration in version order.
+
+    Databases created before migrations existed already have some of these
+    tables and indexes; "already exists" errors are therefore skipped so
+    they are upgraded in place and simply get their versions recorded.
+    """
+    applied = applied_migrations(cursor)
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+    if not pending:
+        print("Schema is up to date.")
+        return
+
+    for version, description, statements in pending:
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except backend.errors as err:
+                if not backend.is_already_exists(err):
+                    raise
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, NOW())",
+            (version, description)
+        )
+        print(f"Applied migration {version}: {description}")
+
+
+def migration_status():
+    """Print applied and pending migrations"""
+    backend = get_backend()
+    conn = backend.acquire()
+    cursor = backend.cursor(conn)
+    try:
+        applied = applied_migrations(cursor)
+        for version, description, _ in MIGRATIONS:
+            state = 'applied' if version in applied else 'pending'
+            print(f"{version:>4}  {state:<8} {description}")
+    finally:
+        cursor.close()
+        backend.release(conn)
+
+
+def setup_database():
+    
+    if DB_BACKEND == 'mysql':
+        try:
+            
+            conn = mysql.connector.connect(
+                host=DB_CONFIG['host'],
+                user=DB_CONFIG['user'],
+                password=DB_CONFIG['password']
+            )
+            cursor = conn.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
+            print("Database created successfully!")
+            cursor.close()
+            conn.close()
+        except mysql.connector.Error as err:
+            print(f"Error creating database: {err}")
+            return
+
+    # MySQL DDL below is translated by the backend when running on SQLite
+    backend = get_backend()
+    try:
+        conn = backend.acquire()
+        cursor = backend.cursor(conn)
+    except backend.errors as err:
+        print(f"Error connecting to database: {err}")
+        return
     
-    for table in tables:
-        cursor.execute(table)
-    print("Tables created successfully!")
+    # Create / upgrade the schema
+    try:
+        migrate(backend, cursor)
+    except backend.errors as err:
+        print(f"Error migrating database: {err}")
+        cursor.close()
+        backend.release(conn)
+        return
     
     # Create admin user
     admin_password = hash_password(ACCOUNTS["admin_password"])
@@ -105,7 +280,7 @@ def setup_database():
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (ACCOUNTS["admin"], admin_password, 'admin@example.com', 'Admin', '', 'User', '2000-01-01', '09123456789', 'admin', 1))
         print("Admin user created! Username: admin, Password: admin123")
-    except mysql.connector.IntegrityError:
+    except backend.IntegrityError:
         print("Admin user already exists!")
     
     user_password = hash_password(ACCOUNTS["testuser_password"])
@@ -115,7 +290,7 @@ def setup_database():
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (ACCOUNTS["testuser"], user_password, 'user@example.com', 'Juan', 'Santos', 'Dela Cruz', '2003-05-15', '09987654321', 'user', 1))
         print("Test user created! Username: testuser, Password: user123")
-    except mysql.connector.IntegrityError:
+    except backend.IntegrityError:
         print("Test user already exists!")
     
     # Insert default site content
@@ -133,19 +308,19 @@ def setup_database():
                 INSERT INTO site_content (content_key, content_value)
                 VALUES (%s, %s)
             """, (key, value))
-        except mysql.connector.IntegrityError:
+        except backend.IntegrityError:
             pass
     print("Default site content added!")
     
     conn.commit()
     cursor.close()
-    conn.close()
+    backend.release(conn)
+
+    # The seed accounts bypass models.py, so bring the statistics up to date
+    stats.reconcile()
     
     print("\n=== Database setup complete! ===")
     print("You can now run the app with: python app.py")
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
 ACCOUNTS = {
     "admin": "admin",
     "testuser": "testuser",
@@ -154,5 +329,9 @@ ACCOUNTS = {
 }
 
 if __name__ == '__main__':
-    print("Setting up database...")
-    setup_database()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'status':
+        migration_status()
+    else:
+        print("Setting up database...")
+        setup_database()
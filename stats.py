@@ -0,0 +1,140 @@
+# stats.py - Pre-aggregated user statistics for the admin dashboard
+#
+# Counters (total users, active users, admins) and a per-day signup rollup
+# are kept up to date by the user write functions in models.py, inside the
+# same transaction as the write itself. reconcile() recomputes both from
+# the users table and is run periodically by the maintenance scheduler.
+import logging
+from collections import Counter
+from datetime import date, timedelta
+from database import execute_query, transaction
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('users', 'active_users', 'admins')
+
+# Days shown in the dashboard signup chart
+SIGNUP_CHART_DAYS = 30
+
+_COUNTER_DELTA_SQL = """
+    INSERT INTO stat_counters (name, value) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+"""
+_COUNTER_SET_SQL = """
+    INSERT INTO stat_counters (name, value) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE value = VALUES(value)
+"""
+_SIGNUPS_TODAY_SQL = """
+    INSERT INTO daily_signups (day, signups) VALUES (DATE(NOW()), %s)
+    ON DUPLICATE KEY UPDATE signups = signups + VALUES(signups)
+"""
+_SIGNUPS_DELTA_SQL = """
+    INSERT INTO daily_signups (day, signups) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE signups = signups + VALUES(signups)
+"""
+_SIGNUPS_SET_SQL = """
+    INSERT INTO daily_signups (day, signups) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE signups = VALUES(signups)
+"""
+
+# ============ INCREMENTAL UPDATES ============
+#
+# Each function takes the cursor of the caller's transaction() so the
+# counters commit or roll back together with the user rows they describe.
+
+def _add_counters(cursor, **deltas):
+    rows = [(name, delta) for name, delta in deltas.items() if delta]
+    if rows:
+        cursor.executemany(_COUNTER_DELTA_SQL, rows)
+
+def record_created(cursor, count=1, admins=0):
+    """``count`` new active users (``admins`` of them admins) signed up today"""
+    if count:
+        _add_counters(cursor, users=count, active_users=count, admins=admins)
+        cursor.execute(_SIGNUPS_TODAY_SQL, (count,))
+
+def record_deleted(cursor, rows):
+    """Users were deleted; ``rows`` holds their role, is_active and signup day"""
+    if not rows:
+        return
+    _add_counters(cursor, users=-len(rows),
+                  active_users=-sum(1 for row in rows if row['is_active']),
+                  admins=-sum(1 for row in rows if row['role'] == 'admin'))
+    days = Counter(row['day'] for row in rows if row['day'] is not None)
+    if days:
+        cursor.executemany(_SIGNUPS_DELTA_SQL, [(day, -count) for day, count in days.items()])
+
+def record_status_change(cursor, delta):
+    """``delta`` users were activated (positive) or deactivated (negative)"""
+    _add_counters(cursor, active_users=delta)
+
+def record_role_change(cursor, delta):
+    """``delta`` users became admins (positive) or stopped being admins (negative)"""
+    _add_counters(cursor, admins=delta)
+
+# ============ READS ============
+
+def get_counters():
+    """Current counters as a dict; one primary-key scan of a three-row table"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    rows = execute_query("SELECT name, value FROM stat_counters", fetch=True) or []
+    counters.update((row['name'], int(row['value'])) for row in rows)
+    return counters
+
+def get_daily_signups(days=SIGNUP_CHART_DAYS):
+    """(date, signups) for each of the last ``days`` days, oldest first"""
+    today = date.today()
+    since = today - timedelta(days=days - 1)
+    rows = execute_query(
+        "SELECT day, signups FROM daily_signups WHERE day >= %s ORDER BY day",
+        (since.isoformat(),), fetch=True
+    ) or []
+    by_day = {str(row['day']): int(row['signups']) for row in rows}
+    return [(day, by_day.get(day.isoformat(), 0))
+            for day in (since + timedelta(days=offset) for offset in range(days))]
+
+# ============ RECONCILIATION ============
+
+def reconcile():
+    """Recompute counters and the signup rollup from the users table.
+
+    The counter rows are locked first, so writers that would change them
+    wait until the recount has committed and none of their deltas are lost.
+    Only counters and days that drifted are rewritten. Returns the drift
+    found as {name or day: correction}.
+    """
+    with transaction() as cursor:
+        cursor.execute("SELECT name, value FROM stat_counters FOR UPDATE")
+        stored = {row['name']: int(row['value']) for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT COUNT(*) AS users,
+                   COALESCE(SUM(is_active = 1), 0) AS active_users,
+                   COALESCE(SUM(role = 'admin'), 0) AS admins
+            FROM users
+        """)
+        actual = {name: int(value) for name, value in cursor.fetchone().items()}
+
+        cursor.execute("SELECT day, signups FROM daily_signups")
+        stored_days = {str(row['day']): int(row['signups']) for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT DATE(created_at) AS day, COUNT(*) AS signups FROM users
+            WHERE created_at IS NOT NULL GROUP BY DATE(created_at)
+        """)
+        actual_days = {str(row['day']): int(row['signups']) for row in cursor.fetchall()}
+
+        drift = {name: actual[name] - stored.get(name, 0)
+                 for name in COUNTERS if actual[name] != stored.get(name)}
+        if drift:
+            cursor.executemany(_COUNTER_SET_SQL, [(name, actual[name]) for name in drift])
+
+        day_drift = {day: actual_days.get(day, 0) - stored_days.get(day, 0)
+                     for day in stored_days.keys() | actual_days.keys()
+                     if actual_days.get(day, 0) != stored_days.get(day, 0)}
+        if day_drift:
+            cursor.executemany(_SIGNUPS_SET_SQL,
+                               [(day, actual_days.get(day, 0)) for day in sorted(day_drift)])
+            drift.update(day_drift)
+
+    if drift:
+        logger.warning("Statistics drifted, corrected: %s", drift)
+    return drift
@@ -0,0 +1,548 @@
+# test_units.py - Unit tests for logic that needs no MySQL server
+#
+# Usage: python -m pytest -q tests
+# The app is imported against a throwaway SQLite file, so nothing here
+# touches the database configured in .env.
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+_tmp = tempfile.mkdtemp(prefix='app-tests-')
+os.environ.update({
+    'DB_BACKEND': 'sqlite',
+    'SQLITE_PATH': os.path.join(_tmp, 'test.db'),
+    'MAINTENANCE_ENABLED': 'False',
+    'HOMEPAGE_CACHE_WARMUP': 'False',
+    'RATELIMIT_BACKEND': 'memory',
+    'PASSWORD_HASH_METHOD': 'scrypt:16384:8:1'
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask, session
+from werkzeug.datastructures import FileStorage
+from database import DatabaseError, execute_query, get_backend, transaction
+import setup_database
+
+
+def _migrate():
+    backend = get_backend()
+    conn = backend.acquire()
+    cursor = backend.cursor(conn)
+    try:
+        setup_database.migrate(backend, cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        backend.release(conn)
+
+_migrate()
+
+import app as app_module
+import css_pipeline
+import models
+import passwords
+from cache import LRUBackend, ObjectCache, TTLCache
+from db_backends import SQLITE_NOW, translate_sqlite
+from page_cache import PageCache
+import ratelimit
+import user_sessions
+
+
+# ============ CSV IMPORT ============
+
+CSV_HEADER = 'username,password,email,firstname,middlename,lastname,birthday,contact,role\n'
+
+def read_csv(text):
+    return app_module.read_user_csv(FileStorage(stream=io.BytesIO(text.encode('utf-8'))))
+
+def test_csv_valid_rows():
+    users, errors = read_csv(CSV_HEADER
+                             + 'ann,pw1,ann@example.com,Ann,,Lee,1990-01-31,555,\n'
+                             + ' bob ,pw2,bob@example.com,Bob,J,Ray,1985-12-01,556,admin\n')
+    assert errors == []
+    assert users == [
+        ('ann', 'pw1', 'ann@example.com', 'Ann', '', 'Lee', '1990-01-31', '555', 'user', None),
+        ('bob', 'pw2', 'bob@example.com', 'Bob', 'J', 'Ray', '1985-12-01', '556', 'admin', None)
+    ]
+
+def test_csv_byte_order_mark_and_optional_columns():
+    users, errors = read_csv('\ufeffusername,password,email,firstname,lastname,birthday,contact\n'
+                             'ann,pw,ann@example.com,Ann,Lee,1990-01-31,555\n')
+    assert errors == []
+    assert users == [('ann', 'pw', 'ann@example.com', 'Ann', '', 'Lee', '1990-01-31', '555', 'user', None)]
+
+def test_csv_missing_columns():
+    users, errors = read_csv('username,password,email\nann,pw,ann@example.com\n')
+    assert users == []
+    assert errors == ['Missing columns: firstname, lastname, birthday, contact']
+    users, errors = read_csv('username,email,firstname,lastname,birthday,contact\n')
+    assert errors == ['Missing columns: password or password_hash']
+
+def test_csv_password_hashes():
+    stored = 'scrypt:32768:8:1$salt$' + 'ab' * 32
+    users, errors = read_csv('username,password,password_hash,email,firstname,lastname,birthday,contact\n'
+                             f'ann,,{stored},ann@example.com,Ann,Lee,1990-01-31,555\n'
+                             f'bob,,{"0" * 64},bob@example.com,Bob,Ray,1990-01-31,556\n')
+    assert errors == []
+    assert [(user[1], user[9]) for user in users] == [(None, stored), (None, '0' * 64)]
+    users, errors = read_csv('username,password,password_hash,email,firstname,lastname,birthday,contact\n'
+                             'ann,pw,not-a-hash,ann@example.com,Ann,Lee,1990-01-31,555\n'
+                             'bob,,plain,bob@example.com,Bob,Ray,1990-01-31,556\n')
+    assert errors == ["line 2: give either password or password_hash, not both",
+                      "line 3: password_hash is not a supported hash"]
+
+def test_csv_limits_plain_text_passwords(monkeypatch):
+    monkeypatch.setattr(app_module, 'IMPORT_MAX_PLAIN_PASSWORDS', 2)
+    rows = ''.join(f'u{i},pw,u{i}@example.com,U,,V,1990-01-31,555,\n' for i in range(3))
+    users, errors = read_csv(CSV_HEADER + rows)
+    assert len(users) == 3
+    assert errors and errors[0].startswith('3 rows have plain-text passwords')
+
+def test_csv_row_errors_name_their_line():
+    users, errors = read_csv(CSV_HEADER
+                             + 'ann,pw,ann@example.com,Ann,,Lee,1990-01-31,555,user\n'
+                             + 'bob,,bob@example.com,Bob,,Ray,1985-12-01,556,user\n'
+                             + 'cat,pw,cat@example.com,Cat,,Ng,1985-12-01,557,root\n'
+                             + 'ann,pw,ann2@example.com,Ann,,Two,1990-01-31,558,user\n'
+                             + 'dan,pw,ann@example.com,Dan,,Oz,1990-01-31,559,user\n'
+                             + 'eve,pw,eve@example.com,Eve,,Ho,31/01/1990,560,user\n')
+    assert [user[0] for user in users] == ['ann']
+    assert errors == [
+        "line 3: missing required field",
+        "line 4: invalid role 'root'",
+        "line 5: duplicate username 'ann' in file",
+        "line 6: duplicate email 'ann@example.com' in file",
+        "line 7: birthday must be YYYY-MM-DD"
+    ]
+
+
+# ============ SQLITE DIALECT ============
+
+def test_sqlite_placeholders_and_now():
+    assert (translate_sqlite("SELECT * FROM users WHERE id = %s AND created_at < NOW()")
+            == f"SELECT * FROM users WHERE id = ? AND created_at < {SQLITE_NOW}")
+
+def test_sqlite_intervals():
+    assert (translate_sqlite("DELETE FROM otp_codes WHERE created_at < DATE_SUB(NOW(), INTERVAL 10 MINUTE)")
+            == "DELETE FROM otp_codes WHERE created_at < datetime('now', 'localtime', '-10 minutes')")
+    assert (translate_sqlite("SELECT DATE_SUB(NOW(), INTERVAL %s HOUR)")
+            == "SELECT datetime('now', 'localtime', '-' || ? || ' hours')")
+    assert (translate_sqlite("SELECT DATE_ADD(NOW(), INTERVAL %s SECOND)")
+            == "SELECT datetime('now', 'localtime', '+' || ? || ' seconds')")
+
+def test_sqlite_upsert():
+    query = translate_sqlite("""
+        INSERT INTO stat_counters (name, value) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    """)
+    assert "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value" in query
+    assert "VALUES (?, ?)" in query
+
+def test_sqlite_insert_ignore_and_for_update():
+    assert (translate_sqlite("INSERT IGNORE INTO rate_limits (limit_key) VALUES (%s)")
+            == "INSERT OR IGNORE INTO rate_limits (limit_key) VALUES (?)")
+    assert (translate_sqlite("SELECT state FROM rate_limits WHERE limit_key = %s FOR UPDATE")
+            == "SELECT state FROM rate_limits WHERE limit_key = ?")
+
+def test_sqlite_schema_types():
+    query = translate_sqlite("""
+        CREATE TABLE t (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            role ENUM('user', 'admin') DEFAULT 'user',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    assert "id INTEGER PRIMARY KEY AUTOINCREMENT" in query
+    assert "role TEXT DEFAULT 'user'" in query
+    assert f"updated_at TIMESTAMP DEFAULT ({SQLITE_NOW})\n" in query
+
+
+# ============ HOMEPAGE CACHE ============
+
+def test_ttl_cache_keeps_last_value_when_loader_fails():
+    cache = TTLCache('homepage', ttl=0)
+    results = iter(['first', None, 'second'])
+    loader = lambda: next(results)
+    assert cache.get('key', loader) == 'first'
+    assert cache.get('key', loader) == 'first'
+    assert cache.get('key', loader) == 'second'
+
+def test_ttl_cache_stores_nothing_for_failed_first_load():
+    cache = TTLCache('homepage', ttl=60)
+    assert cache.get('key', lambda: None) is None
+    assert cache.stats()['entries'] == 0
+    assert cache.get('key', lambda: 'loaded') == 'loaded'
+
+
+# ============ PAGE CACHE ============
+
+class FixedStamp:
+    """Stands in for a VersionStamp whose version the test sets"""
+
+    def __init__(self, version=1):
+        self.version = version
+
+    def current(self, wait=True):
+        return self.version
+
+def page_app(cache, stamp=None):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.renders = 0
+
+    @app.route('/<name>')
+    @cache.cached(version=stamp)
+    def page(name):
+        app.renders += 1
+        return f'{name} v{stamp.version if stamp else 0}'
+
+    @app.route('/login')
+    def login():
+        session['user_id'] = 1
+        return 'ok'
+
+    return app
+
+def wait_for_refresh(cache, timeout=5):
+    deadline = time.monotonic() + timeout
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_page_cache_hit_and_304():
+    cache = PageCache(ttl=60, enabled=True)
+    app = page_app(cache)
+    client = app.test_client()
+    first = client.get('/a')
+    second = client.get('/a')
+    assert first.status_code == second.status_code == 200
+    assert app.renders == 1
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    revalidated = client.get('/a', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == first.headers['ETag']
+    assert cache.stats()['not_modified'] == 1
+
+def test_page_cache_304_repeats_encoded_etag():
+    cache = PageCache(ttl=60, enabled=True)
+    client = page_app(cache).test_client()
+    etag = client.get('/a').get_etag()[0]
+    response = client.get('/a', headers={'If-None-Match': f'"{etag}-gzip"'})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == f'"{etag}-gzip"'
+
+def test_page_cache_skips_query_strings_and_sessions():
+    cache = PageCache(ttl=60, enabled=True)
+    app = page_app(cache)
+    client = app.test_client()
+    client.get('/a?x=1')
+    client.get('/a?x=2')
+    assert app.renders == 2
+    assert 'ETag' not in client.get('/a?x=3').headers
+    client.get('/login')
+    client.get('/a')
+    client.get('/a')
+    assert app.renders == 5
+    assert cache.stats()['pages'] == 0
+
+def test_page_cache_serves_outdated_page_while_refreshing():
+    stamp = FixedStamp(1)
+    cache = PageCache(ttl=60, enabled=True)
+    app = page_app(cache, stamp)
+    client = app.test_client()
+    old = client.get('/a')
+    stamp.version = 2
+    assert client.get('/a').data == old.data == b'a v1'
+    wait_for_refresh(cache)
+    assert client.get('/a').data == b'a v2'
+    assert app.renders == 2
+    assert cache.stats()['stale_served'] == 1
+
+def test_page_cache_is_bounded():
+    cache = PageCache(ttl=60, enabled=True, maxsize=2)
+    client = page_app(cache).test_client()
+    for name in ('a', 'b', 'c'):
+        client.get(f'/{name}')
+    assert cache.stats()['pages'] == 2
+    assert cache._pages.get('/a') is None
+
+
+# ============ CSS PIPELINE ============
+
+def minify(css):
+    return css_pipeline.minify(css_pipeline.parse(css))
+
+def test_minify_declarations_and_selectors():
+    assert (minify("/* theme */\nh1 ,  h2 > span  { margin : 0 auto ;  color:red  !important; }")
+            == "h1,h2>span{margin:0 auto;color:red!important}")
+    assert minify(".quote::before { content: \"a;b\"; }") == '.quote::before{content:"a;b"}'
+    assert minify(".empty { }") == ""
+
+def test_minify_at_rules():
+    assert (minify('@import url("print.css") print;\n'
+                   '@media (max-width: 600px) {\n  .card   .title { font-family: Arial , sans-serif; }\n}')
+            == '@import url("print.css") print;'
+               '@media (max-width: 600px){.card .title{font-family:Arial,sans-serif}}')
+    assert (minify("@keyframes spin { from { opacity: 0 } to { opacity: 1 } }")
+            == "@keyframes spin{from{opacity:0}to{opacity:1}}")
+
+def test_critical_css_keeps_rules_the_markup_can_match():
+    markup = css_pipeline.TemplateMarkup()
+    markup.add_source('<nav id="top"><div class="card {{ kind }}"><p class="lead">x</p></div></nav>')
+    rules = css_pipeline.parse("""
+        :root { --x: 1px; }
+        .card.highlight { a: 1 }
+        .card .title { a: 2 }
+        .lead, .missing { a: 3 }
+        nav#top a { a: 4 }
+        button:hover { a: 5 }
+        p:first-child { a: 6 }
+        #top > div { a: 7 }
+        @font-face { font-family: X; }
+        @media print { .lead { a: 8 } .gone { a: 9 } }
+    """)
+    assert (css_pipeline.minify(markup.critical(rules))
+            == ":root{--x:1px}.card.highlight{a:1}.lead{a:3}p:first-child{a:6}#top>div{a:7}"
+               "@media print{.lead{a:8}}")
+
+def test_critical_css_follows_extends_and_includes():
+    pipeline = app_module.app.extensions['css']
+    markup = pipeline._markup('admin_users.html')
+    base = pipeline._markup('base.html')
+    assert base.tags <= markup.tags
+    assert base.classes <= markup.classes
+    assert pipeline.critical('admin_users.html')
+
+
+# ============ RATE LIMITS ============
+
+def run(algorithm, times, limit, period, cost=1, state=None):
+    decisions = []
+    for now in times:
+        state, decision = algorithm(state, now, limit, period, cost)
+        decisions.append(decision)
+    return state, decisions
+
+def test_sliding_window_within_one_window():
+    _, decisions = run(ratelimit.sliding_window, [120, 125, 128, 130], limit=3, period=60)
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions] == [2, 1, 0, 0]
+    # the weighted count drops to 2 at 200, when a third of the next window has passed
+    assert decisions[-1].retry_after == pytest.approx(70)
+
+def test_sliding_window_weights_previous_window():
+    state, _ = run(ratelimit.sliding_window, [120, 125, 128], limit=3, period=60)
+    state, [denied] = run(ratelimit.sliding_window, [195], limit=3, period=60, state=state)
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(5)
+    _, [allowed] = run(ratelimit.sliding_window, [200], limit=3, period=60, state=state)
+    assert allowed.allowed and allowed.remaining == 0
+
+def test_sliding_window_forgets_older_windows():
+    state, _ = run(ratelimit.sliding_window, [120, 125, 128], limit=3, period=60)
+    _, [decision] = run(ratelimit.sliding_window, [250], limit=3, period=60, state=state)
+    assert decision.allowed and decision.remaining == 2
+
+def test_sliding_window_cost():
+    _, decisions = run(ratelimit.sliding_window, [0, 1], limit=3, period=60, cost=2)
+    assert [d.allowed for d in decisions] == [True, False]
+    assert decisions[1].retry_after == pytest.approx(59 + 60 * (1 - 1 / 2))
+
+def test_token_bucket_bursts_then_refills():
+    state, decisions = run(ratelimit.token_bucket, [0, 0, 0], limit=2, period=10)
+    assert [d.allowed for d in decisions] == [True, True, False]
+    assert [d.remaining for d in decisions] == [1, 0, 0]
+    assert decisions[-1].retry_after == pytest.approx(5)
+    state, [early] = run(ratelimit.token_bucket, [2.5], limit=2, period=10, state=state)
+    assert not early.allowed and early.retry_after == pytest.approx(2.5)
+    _, [refilled] = run(ratelimit.token_bucket, [5], limit=2, period=10, state=state)
+    assert refilled.allowed and refilled.remaining == 0
+
+def test_token_bucket_caps_at_limit():
+    state, _ = run(ratelimit.token_bucket, [0], limit=2, period=10)
+    _, [decision] = run(ratelimit.token_bucket, [1000], limit=2, period=10, state=state)
+    assert decision.allowed and decision.remaining == 1
+
+def test_rate_limit_through_memory_backend(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'backend', ratelimit.MemoryBackend(maxsize=10))
+    rule = ratelimit.RateLimit('test', 2, 60, algorithm='token-bucket')
+    assert [rule.hit('a').allowed for _ in range(3)] == [True, True, False]
+    assert rule.hit('b').allowed
+
+@pytest.mark.skipif(ratelimit.fcntl is None, reason='needs fcntl')
+def test_shared_memory_backend_is_shared_between_instances():
+    path = os.path.join(_tmp, 'ratelimit.shm')
+    first = ratelimit.SharedMemoryBackend(path=path, slots=64)
+    second = ratelimit.SharedMemoryBackend(path=path, slots=64)
+    step = lambda state: ratelimit.token_bucket(state, time.time(), 2, 60)
+    assert first.update('key', step, 120).allowed
+    assert second.update('key', step, 120).allowed
+    assert not first.update('key', step, 120).allowed
+
+@pytest.mark.skipif(ratelimit.fcntl is None or not hasattr(os, 'fork'), reason='needs fcntl and fork')
+def test_shared_memory_backend_excludes_forked_workers():
+    # created before forking, like an app preloaded by gunicorn
+    backend = ratelimit.SharedMemoryBackend(path=os.path.join(_tmp, 'fork.shm'), slots=64)
+    count = lambda state: (((state or (0.0,))[0] + 1, 0.0, 0.0), None)
+    workers, hits = 4, 2000
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                for _ in range(hits):
+                    backend.update('key', count, 60)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    total = backend.update('key', lambda state: (state, state[0]), 60)
+    assert total == workers * hits
+
+
+# ============ TRANSACTIONS ============
+
+@pytest.fixture
+def app_context():
+    with app_module.app.app_context():
+        yield
+
+@pytest.fixture
+def scratch(app_context):
+    execute_query("CREATE TABLE IF NOT EXISTS tx_scratch (name VARCHAR(50) NOT NULL)")
+    execute_query("DELETE FROM tx_scratch")
+
+def scratch_rows():
+    return [row['name'] for row in execute_query("SELECT name FROM tx_scratch ORDER BY name", fetch=True)]
+
+def test_transaction_commits(scratch):
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO tx_scratch (name) VALUES (%s)", ('a',))
+        cursor.execute("INSERT INTO tx_scratch (name) VALUES (%s)", ('b',))
+    assert scratch_rows() == ['a', 'b']
+
+def test_transaction_rolls_back_on_exception(scratch):
+    with pytest.raises(RuntimeError):
+        with transaction() as cursor:
+            cursor.execute("INSERT INTO tx_scratch (name) VALUES (%s)", ('a',))
+            raise RuntimeError('abort')
+    assert scratch_rows() == []
+
+def test_transaction_rolls_back_and_wraps_database_errors(scratch):
+    with pytest.raises(DatabaseError):
+        with transaction() as cursor:
+            cursor.execute("INSERT INTO tx_scratch (name) VALUES (%s)", ('a',))
+            cursor.execute("INSERT INTO no_such_table (name) VALUES (%s)", ('b',))
+    assert scratch_rows() == []
+
+def test_nested_transaction_joins_the_open_one(scratch):
+    with pytest.raises(RuntimeError):
+        with transaction() as outer:
+            outer.execute("INSERT INTO tx_scratch (name) VALUES (%s)", ('outer',))
+            with transaction() as inner:
+                inner.execute("INSERT INTO tx_scratch (name) VALUES (%s)", ('inner',))
+            # the inner block did not commit; this undoes both rows
+            raise RuntimeError('abort')
+    assert scratch_rows() == []
+
+
+# ============ USER CACHE ============
+
+def test_object_cache_invalidate_drops_aliases():
+    cache = ObjectCache('users', LRUBackend(maxsize=100, ttl=60))
+    loads = []
+    def loader():
+        loads.append(1)
+        return {'id': 7, 'username': 'ann', 'email': 'ann@example.com'}
+
+    assert cache.get_by('username', 'ann', 'row', loader)['id'] == 7
+    assert cache.get_by('email', 'ann@example.com', 'row', loader)['id'] == 7
+    assert cache.get_by('username', 'ann', 'row', loader)['id'] == 7
+    assert cache.get(7, 'row', loader)['id'] == 7
+    assert len(loads) == 2
+
+    cache.invalidate(7)
+    assert cache.backend.get(('username', 'ann')) is None
+    assert cache.backend.get(('email', 'ann@example.com')) is None
+    assert cache.backend.get(('id', 7)) is None
+    cache.get_by('email', 'ann@example.com', 'row', loader)
+    assert len(loads) == 3
+
+
+# ============ SESSION SNAPSHOTS ============
+
+def new_user(password='secret'):
+    name = f'u{uuid.uuid4().hex[:12]}'
+    assert models.create_user(name, password, f'{name}@example.com', 'Test', '', 'User',
+                              '2000-01-01', '0900')
+    return models.get_user_by_username(name, models.USER_SESSION_COLUMNS)
+
+def test_revoked_snapshot_fails_current_user():
+    with app_module.app.test_request_context('/'):
+        user = new_user()
+        app_module.start_user_session(user)
+        assert app_module.current_user()['id'] == user['id']
+
+        assert models.update_user_status(user['id'], 0)
+        assert app_module.current_user() is None
+        assert not session.get('loggedIn')
+
+def test_other_workers_see_revocations_on_their_next_sync():
+    with app_module.app.test_request_context('/'):
+        user = new_user()
+        snapshot = user_sessions.snapshot(user)
+        worker = user_sessions.RevocationMap()    # another worker's copy of the map
+        assert worker.is_current(user['id'], snapshot['v'])
+        models.delete_user(user['id'])
+        worker.invalidate()                       # as if its stamp check were due
+        assert not worker.is_current(user['id'], snapshot['v'])
+
+def test_expired_snapshot_is_not_current():
+    with app_module.app.test_request_context('/'):
+        snapshot = user_sessions.snapshot(new_user())
+        assert user_sessions.is_current(snapshot)
+        snapshot['issued'] -= app_module.SESSION_LIFETIME_DAYS * 86400 + 1
+        assert not user_sessions.is_current(snapshot)
+
+
+# ============ PASSWORDS ============
+
+def stored_password(user_id):
+    rows = execute_query("SELECT password FROM users WHERE id = %s", (user_id,), fetch=True)
+    return rows[0]['password']
+
+def test_legacy_hash_verifies_and_is_rehashed_on_login():
+    with app_module.app.test_request_context('/'):
+        user = new_user()
+        legacy = hashlib.sha256(b'legacy-password').hexdigest()
+        execute_query("UPDATE users SET password = %s WHERE id = %s", (legacy, user['id']))
+        models.user_cache.invalidate(user['id'])
+
+        assert models.verify_login(user['username'], 'wrong') is None
+        assert stored_password(user['id']) == legacy
+        assert models.verify_login(user['username'], 'legacy-password')['id'] == user['id']
+        upgraded = stored_password(user['id'])
+        assert upgraded.startswith(passwords.PASSWORD_HASH_METHOD + '$')
+        assert not passwords.needs_rehash(upgraded)
+        assert models.verify_login(user['username'], 'legacy-password')['id'] == user['id']
+
+def test_needs_rehash():
+    assert passwords.needs_rehash(hashlib.sha256(b'pw').hexdigest())
+    assert passwords.needs_rehash(passwords._hash('pw', 'pbkdf2:sha256:1000'))
+    assert passwords.needs_rehash(passwords._hash('pw', 'scrypt:2048:8:1'))
+    assert not passwords.needs_rehash(passwords._hash('pw'))
+
+def test_verify_password():
+    stored = passwords._hash('pw', 'pbkdf2:sha256:1000')
+    assert passwords.verify_password(stored, 'pw')
+    assert not passwords.verify_password(stored, 'other')
+    assert passwords.verify_password(hashlib.sha256(b'pw').hexdigest(), 'pw')
+    assert not passwords.verify_password(None, 'pw')
@@ -0,0 +1,118 @@
+# user_sessions.py - Versioned user snapshots carried in the session cookie
+#
+# At login the user's display fields are copied into the (signed) Flask
+# session together with users.session_version. Deactivating, deleting or
+# editing a user as admin bumps that version and records it in
+# session_revocations; every worker keeps the table in memory and refuses
+# snapshots older than the recorded version, so authenticated pages can be
+# served without loading the user row.
+#
+# Each revocation is stamped with the 'sessions' cache version it was
+# written under (seq), so workers only fetch the rows written since their
+# last sync. Snapshots expire after SESSION_LIFETIME_DAYS, which lets
+# maintenance.py purge revocations older than that.
+import threading
+import time
+from database import execute_query
+from cache import VersionStamp, bump_version
+from config import SESSION_LIFETIME_DAYS
+
+SESSIONS_CACHE = 'sessions'
+
+# Minimum version recorded for deleted users: no snapshot is ever current
+REVOKED_ALL = 2 ** 31 - 1
+
+SNAPSHOT_FIELDS = ('id', 'username', 'email', 'firstname', 'middlename',
+                   'lastname', 'birthday', 'contact', 'role')
+
+
+def snapshot(user):
+    """Session-safe copy of ``user`` (a row with SNAPSHOT_FIELDS and session_version)"""
+    data = {field: user[field] for field in SNAPSHOT_FIELDS}
+    if data['birthday'] is not None:
+        data['birthday'] = str(data['birthday'])
+    data['v'] = user['session_version']
+    data['issued'] = int(time.time())
+    return data
+
+
+class RevocationMap:
+    """user_id -> oldest session_version still accepted, mirrored from the database.
+
+    Rows written since the last sync are fetched only when the 'sessions'
+    version stamp changes, which is checked at most every
+    CACHE_VERSION_CHECK_SECONDS.
+    """
+
+    def __init__(self):
+        self.version = VersionStamp(SESSIONS_CACHE)
+        self._seen_version = None
+        self._min_versions = {}
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        version = self.version.current()
+        if version == self._seen_version:
+            return
+        with self._lock:
+            if version == self._seen_version:
+                return
+            query = "SELECT user_id, session_version FROM session_revocations"
+            params = None
+            if self._seen_version is not None:
+                # seq is the stamp each row was written under; newer rows
+                # show up in a later sync if they commit after this one
+                query += " WHERE seq > %s"
+                params = (self._seen_version,)
+            rows = execute_query(query, params, fetch=True)
+            if rows is None:
+                return  # query error, already logged; keep the last known map
+            self._min_versions.update((row['user_id'], row['session_version']) for row in rows)
+            self._seen_version = version
+
+    def is_current(self, user_id, session_version):
+        self._sync()
+        return session_version >= self._min_versions.get(user_id, 0)
+
+    def invalidate(self):
+        """Re-check the stamp on next use (after this worker revoked sessions)"""
+        self.version.reset()
+
+
+revocations = RevocationMap()
+
+
+def is_current(snapshot):
+    """True unless ``snapshot`` has expired or was revoked"""
+    issued = snapshot.get('issued', 0)
+    if time.time() - issued > SESSION_LIFETIME_DAYS * 86400:
+        return False
+    return revocations.is_current(snapshot['id'], snapshot['v'])
+
+
+def revoke(cursor, user_ids):
+    """Record the bumped session_version of ``user_ids`` (inside the write's transaction).
+
+    ``user_ids`` should be one bounded chunk; it becomes an IN (...) list.
+    """
+    bump_version(cursor, SESSIONS_CACHE)
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(f"""
+        INSERT INTO session_revocations (user_id, session_version, seq, updated_at)
+        SELECT id, session_version, (SELECT version FROM cache_versions WHERE name = %s), NOW()
+        FROM users WHERE id IN ({placeholders})
+        ON DUPLICATE KEY UPDATE session_version = VALUES(session_version), seq = VALUES(seq),
+                                updated_at = VALUES(updated_at)
+    """, (SESSIONS_CACHE,) + tuple(user_ids))
+
+def revoke_deleted(cursor, user_ids):
+    """Refuse every session of deleted users"""
+    bump_version(cursor, SESSIONS_CACHE)
+    cursor.execute("SELECT version FROM cache_versions WHERE name = %s", (SESSIONS_CACHE,))
+    seq = cursor.fetchone()['version']
+    cursor.executemany("""
+        INSERT INTO session_revocations (user_id, session_version, seq, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE session_version = VALUES(session_version), seq = VALUES(seq),
+                                updated_at = VALUES(updated_at)
+    """, [(user_id, REVOKED_ALL, seq) for user_id in user_ids])